@@ -1,6 +1,7 @@
 
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
+import os
 import sys
 
 import matplotlib.dates as mdates
@@ -11,8 +12,6 @@ import numpy as np
 import warnings
 warnings.filterwarnings("ignore")
 
-from readBackwards import BackwardsReader
-
 CONT_PLOT = True
 FIG = None
 READ_BUFFER = 0
@@ -21,6 +20,107 @@ READ_BUFFER_USELESS = 500
 # stop the plot window popping to the front with every update
 plt.rcParams["figure.raise_window"] = False
 
+class Readings:
+    """Growing arrays of one sensor's readings: times, values, and the byte offset in the log of each line."""
+    def __init__(self, dtype=np.float64):
+        self.count = 0
+        self._times = np.zeros(0, dtype="datetime64[s]")
+        self._values = np.zeros(0, dtype=dtype)
+        self._offsets = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, times, values, offsets):
+        """Add readings, reallocating (doubling) only when full."""
+        n = len(times)
+        if self.count + n > len(self._times):
+            capacity = max(2*len(self._times), self.count + n, 64)
+            for name in ("_times", "_values", "_offsets"):
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self.count] = old[:self.count]
+                setattr(self, name, new)
+        self._times[self.count:self.count + n] = times
+        self._values[self.count:self.count + n] = values
+        self._offsets[self.count:self.count + n] = offsets
+        self.count += n
+
+    def since(self, offset=0):
+        """`(times, values)` views of the readings from log lines at or after byte `offset`."""
+        first = np.searchsorted(self._offsets[:self.count], offset)
+        return self._times[first:self.count], self._values[first:self.count]
+
+class LogTail:
+    """Follows a growing cooler log.
+
+    The file stays open, and each `update()` only reads what was appended
+    since the last call. New complete lines are parsed once and appended
+    to `readings` (one `Readings` per sensor in `sensors`) or to `misc`
+    (any other logged line, except `ptc` queries), so each refresh costs
+    time in proportion to the new data rather than to the whole log.
+    The first line of the log is not used.
+    """
+    sensors = ("T1", "S1", "C1", "T2")
+
+    def __init__(self, file_name):
+        self.file = open(file_name, "rb")
+        self.reset()
+
+    def reset(self):
+        # file position of the first line not yet parsed
+        self.offset = 0
+        self.readings = {name: Readings() for name in self.sensors}
+        self.misc = Readings(dtype=object)
+
+    def close(self):
+        self.file.close()
+
+    def update(self):
+        """Parse any newly completed lines. Returns how many lines were read."""
+        if os.fstat(self.file.fileno()).st_size < self.offset:
+            # the log was truncated or replaced; start again
+            self.reset()
+        self.file.seek(self.offset)
+        new = self.file.read()
+        end = new.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+
+        lines = new[:end].split(b"\n")[:-1]
+        offsets = self.offset + np.concatenate(([0], np.cumsum([len(line) + 1 for line in lines[:-1]], dtype=np.int64)))
+        if self.offset == 0:
+            lines, offsets = lines[1:], offsets[1:]
+        self.offset += end
+
+        found = {name: ([], [], []) for name in self.sensors + ("misc",)}
+        for line, offset in zip(lines, offsets):
+            parts = line.decode("utf-8", errors="replace").replace("[", "").rstrip("\r").split("]  ", 1)
+            if len(parts) != 2 or len(parts[0]) != 19 or parts[1] == "ptc":
+                continue
+            stamp, command = parts
+            # "2025-06-13_11-30-43" to ISO 8601, "2025-06-13T11:30:43"
+            time = stamp[:10] + "T" + stamp[11:].replace("-", ":")
+            name, value = "misc", command
+            head, _, rest = command.partition(" ")
+            if head in self.readings:
+                try:
+                    name, value = head, float(rest)
+                except ValueError:
+                    pass
+            times, values, line_offsets = found[name]
+            times.append(time)
+            values.append(value)
+            line_offsets.append(offset)
+
+        for name, (times, values, line_offsets) in found.items():
+            if len(times) == 0:
+                continue
+            readings = self.misc if name == "misc" else self.readings[name]
+            values = np.array(values, dtype=object) if name == "misc" else values
+            readings.append(np.array(times, dtype="datetime64[s]"), values, line_offsets)
+        return len(lines)
+
 async def plot_temps(file_name):
     await asyncio.sleep(5) # let the temepratures to be written a bit first
     plt.ion()
@@ -36,6 +136,8 @@ async def plot_temps(file_name):
     text_box = TextBox(axbox, "Read Buffer [bytes]", textalignment="center")
     text_box.on_submit(submit)
     text_box.set_val(globals()["READ_BUFFER"])  # Trigger `submit` with the initial string.
+    tail = LogTail(file_name)
+    shown = None
     try:
         while CONT_PLOT:
             await asyncio.sleep(0.5)
@@ -45,22 +147,24 @@ async def plot_temps(file_name):
                 print(f"0<[Read-buffer]<{READ_BUFFER_USELESS} will likely result in no data, setting to {READ_BUFFER_USELESS}.")     
                 text_box.set_val(READ_BUFFER_USELESS)
 
-            with BackwardsReader(file=file_name, blksize=globals()["READ_BUFFER"], forward=True) as f:
-                data = f.readlines()
-            result = data_parser(data)
-            
-            if result is None:
+            # only lines appended since the last refresh are read and parsed
+            new_lines = tail.update()
+            if new_lines == 0 and shown == globals()["READ_BUFFER"]:
+                plt.pause(0.1)
                 continue
-            t1, s1, c1, t2, misc = result
+            shown = globals()["READ_BUFFER"]
+            since = max(tail.offset - shown, 0) if shown > 0 else 0
 
-            t1_plot = True if np.ndim(t1)==2 else False
-            s1_plot = True if np.ndim(s1)==2 else False
-            c1_plot = True if np.ndim(c1)==2 else False
-            _t2_plot = True if np.ndim(t2)==2 else False
-            misc_plot = True if np.ndim(misc)==2 else False
+            t1 = tail.readings["T1"].since(since)
+            s1 = tail.readings["S1"].since(since)
+            c1 = tail.readings["C1"].since(since)
+            misc = tail.misc.since(since)
 
-            _temps = tuple([ts[:,1] for ts in (t1, s1, c1) if np.ndim(ts)==2])
-            _times = tuple([ts[:,0] for ts in (t1, s1, c1) if np.ndim(ts)==2])
+            _temps = tuple([ts[1] for ts in (t1, s1, c1) if len(ts[0]) > 0])
+            _times = tuple([ts[0] for ts in (t1, s1, c1) if len(ts[0]) > 0])
+            if len(_temps) == 0:
+                plt.pause(0.1)
+                continue
 
             _all_temps = np.concatenate(_temps)
             _all_times = np.concatenate(_times)
@@ -68,18 +172,9 @@ async def plot_temps(file_name):
             orig.clear()
             #twin.clear()
             
-            if t1_plot:
-                orig.plot(t1[:,0], t1[:,1], color="c", lw=3, label="T1")
-            else:
-                orig.plot(t1, t1, color="c", lw=3, label="T1")
-            if s1_plot:
-                orig.plot(s1[:,0], s1[:,1], color="r", ls="--", lw=3, label="S1")
-            else:
-                orig.plot(s1, s1, color="r", ls="--", lw=3, label="S1")
-            if c1_plot:
-                orig.plot(c1[:,0], c1[:,1], color="m", ls=":", lw=3, label="C1")
-            else:
-                orig.plot(c1, c1, color="m", ls=":", lw=3, label="C1")
+            orig.plot(t1[0], t1[1], color="c", lw=3, label="T1")
+            orig.plot(s1[0], s1[1], color="r", ls="--", lw=3, label="S1")
+            orig.plot(c1[0], c1[1], color="m", ls=":", lw=3, label="C1")
 
             # orig.plot(t2[:,0], t2[:,1], color="m", lw=3, label="T2")
             orig.legend(loc="center left")
@@ -92,19 +187,19 @@ async def plot_temps(file_name):
             
             orig.set_ylabel(u"\u2103")
             twin.set_ylabel(u"\u2109")
-            orig.set_xlabel(f"Time ({_all_times[0].strftime('%Y-%m-%d')})")
+            orig.set_xlabel(f"Time ({_all_times[0].astype(datetime).strftime('%Y-%m-%d')})")
             
             orig.xaxis.set_major_formatter(my_fmt)
             orig.tick_params(axis='x', labelrotation=45)
             _time_max = np.argmax(_all_times-_all_times[0])
             orig.set_xlim([_all_times[0], _all_times[_time_max]])
-            if len(t1)>1:
-                orig.annotate(get_temp_metric_string(t1[:,0], t1[:,1]), (0.01, 0.01), xycoords="axes fraction", ha="left", va="bottom", backgroundcolor=(1,1,1,0.6))
+            if len(t1[0])>1:
+                orig.annotate(get_temp_metric_string(t1[0], t1[1]), (0.01, 0.01), xycoords="axes fraction", ha="left", va="bottom", backgroundcolor=(1,1,1,0.6))
             
-            if misc_plot:
+            if len(misc[0]) > 0:
                 mapping = {0:1, 1:0.95, 2:0.9, 3:0.85}
                 colour = [(0, 0, 0), (0.2, 0.2, 0.2), (0.4, 0.4, 0.4), (0.6, 0.6, 0.6)]
-                for c, a in enumerate(misc):
+                for c, a in enumerate(zip(*misc)):
                     cycle = c%4
                     _ypos = min_c+mapping[cycle]*abs(max_c-min_c)
                     if (a[0]-_all_times[0])/(_all_times[_time_max]-_all_times[0])<=0.5:
@@ -119,6 +214,8 @@ async def plot_temps(file_name):
     except KeyboardInterrupt:
         print("Shut down plotting!")
         sys.exit(0)
+    finally:
+        tail.close()
 
 def submit(read_buffer_size):
     """Function to change the read-buffer size for plotting.
@@ -138,47 +235,12 @@ def on_close(event):
     plt.close(globals()["FIG"])
     globals()["CONT_PLOT"] = False
 
-def data_parser(data):
-    if len(data)<3:
-        return np.array([]), np.array([]), np.array([]), np.array([]), np.array([])
-    
-    data = data[1:]
-    # get rid of end characters
-    trimmed_lines = [d.decode("utf-8").replace("[", "").replace("\n", "") for d in data]
-    # split the time from the command
-    times_and_comms = np.array([d.split("]  ") for d in trimmed_lines])
-    times = np.array([datetime.strptime(d, "%Y-%m-%d_%H-%M-%S") for d in times_and_comms[:,0]])
-    commands = times_and_comms[:,1]
-    _ptc = np.nonzero(commands!="ptc")[0]
-    
-    times = times[_ptc]
-    commands = commands[_ptc]
-    
-    # I'd imagine I could be fancy but I'll just loop normally
-    t1 = []
-    s1 = []
-    c1 = []
-    t2 = []
-    misc = []
-    for command, time in zip(commands, times):
-        if command.startswith("T1 "):
-            t1.append([time, float(command.replace("T1 ", ""))])
-        elif command.startswith("S1 "):
-            s1.append([time, float(command.replace("S1 ", ""))])
-        elif command.startswith("C1 "):
-            c1.append([time, float(command.replace("C1 ", ""))])
-        elif command.startswith("T2 "):
-            t2.append([time, float(command.replace("T2 ", ""))])
-        else:
-            misc.append([time, command])
-
-    return np.array(t1), np.array(s1), np.array(c1), np.array(t2), np.array(misc)
-
 def c2f(celsius):
     return celsius * 9.0 / 5.0 + 32.0
 
 def get_temp_metric_string(times, temp_c, unit=u"\u2103"):
-    """Default unit is Celsius."""
+    """Default unit is Celsius. `times` can be `datetime`s or `np.datetime64`s."""
+    times = np.asarray(times, dtype="datetime64[us]")
     
     # current info
     temp_sign = "+" if temp_c[-1]>=0 else "-"
@@ -188,7 +250,7 @@ def get_temp_metric_string(times, temp_c, unit=u"\u2103"):
     irate_sign = ""
     irate = np.nan
     if len(times)>1:
-        t_delta = (times[-1]-times[-2]).total_seconds()/60 # in minutes
+        t_delta = (times[-1]-times[-2])/np.timedelta64(1, "m") # in minutes
         temp_delta = temp_c[-1]-temp_c[-2]
         irate_sign = "+" if temp_delta>=0 else "-"
         irate = abs(temp_delta)/t_delta
@@ -211,13 +273,13 @@ def get_temp_metric_string(times, temp_c, unit=u"\u2103"):
 def info_over_time(times, temp_c, t_delta_minutes):
     rate, std = np.nan, np.nan
     rate_sign = ""
-    times = np.array(times)
-    excess_data = times<(times[-1] - timedelta(minutes=t_delta_minutes))
+    times = np.asarray(times, dtype="datetime64[us]")
+    excess_data = times<(times[-1] - np.timedelta64(t_delta_minutes, "m"))
     # if there is more than 1 min of data
     if np.sum(excess_data)>0:
         times = times[~excess_data]
         temp_c = np.array(temp_c)[~excess_data]
-        t_in_mins = [(t-times[0]).total_seconds()/60 for t in times] 
+        t_in_mins = (times-times[0])/np.timedelta64(1, "m")
         rate = get_grad(t_in_mins, temp_c)
         rate_sign = "+" if rate>=0 else "-"
         rate, std = abs(rate), np.std(temp_c)
@@ -1,21 +1,291 @@
 import sys, time, os
+import argparse, concurrent.futures, csv, fnmatch
 import numpy as np
 from matplotlib import pyplot as plt
 
-def do_cdte(path):
+def cdte_pps_times(path, board=3, chunk_size=1 << 24, drop_zero=True):
+    """
+    Read the 1PPS unixtimes for one board from a CdTe text log.
+
+    Parameters
+    ----------
+    `path`: the log file. Its first line is a header, then each line is
+        whitespace-separated columns, with the board number in column
+        1, the keyword (`1PPS`) in column 2 and the unixtime in column 3.
+    `board`: which board's pulses to keep.
+    `chunk_size`: bytes to read at a time.
+    `drop_zero`: leave out pulses logged with a zero unixtime, which
+        are null rows rather than real pulses.
+
+    The file is read in chunks, and only lines containing `1PPS` are
+    split, found by searching the chunk's bytes. Their unixtimes are converted to `float` a chunk at a time
+    and appended to a `np.float64` array that doubles as needed, so
+    memory use follows the number of pulses, not the size of the log.
+
+    Returns the (N,) pulse unixtimes, in file order.
+    """
+    board = str(board).encode()
+    times = np.empty(1024, dtype=np.float64)
+    count = 0
+    with open(path, 'rb') as f:
+        f.readline() # ignore the header
+        rest = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                chunk = rest + chunk
+                end = chunk.rfind(b'\n') + 1
+                block, rest = chunk[:end], chunk[end:]
+            else:
+                block, rest = rest, b''
+            # most of a busy log is other packets, so jump from one `1PPS`
+            # to the next and only split the lines they are on:
+            found = []
+            at = block.find(b'1PPS')
+            while at >= 0:
+                start = block.rfind(b'\n', 0, at) + 1
+                end = block.find(b'\n', at)
+                if end < 0:
+                    end = len(block)
+                cols = block[start:end].split(None, 4)
+                if len(cols) > 3 and cols[2] == b'1PPS' and cols[1] == board:
+                    found.append(cols[3])
+                at = block.find(b'1PPS', end)
+            if found:
+                values = np.array(found).astype(np.float64)
+                if count + len(values) > len(times):
+                    grown = np.empty(max(2*len(times), count + len(values)), dtype=np.float64)
+                    grown[:count] = times[:count]
+                    times = grown
+                times[count:count + len(values)] = values
+                count += len(values)
+            if not chunk:
+                break
+    times = times[:count]
+    if drop_zero:
+        times = times[times != 0]
+    return times
+
+class PPSAnalysis:
+    """
+    Timing statistics of a pulse-per-second train, from `analyze_pps`.
+
+    `times`: (N,) pulse times kept for the analysis, in seconds.
+    `index`: (N,) which nominal second each kept pulse belongs to.
+    `segment`: (N,) which segment of the train each kept pulse is in.
+        The train is split wherever a step between pulses can't be
+        real; `resets` holds the size of each such step, in seconds.
+    `period`: the nominal pulse period, in seconds.
+    `missed`: number of pulses missing, and `gaps`, the positions in
+        `times` after which they are missing.
+    `extra`: number of pulses dropped for sharing a period slot with
+        a pulse closer to its nominal time (see `keep_pulses`).
+    `fit_period`, `fit_offsets`: the linear fit
+        `times ~ fit_offsets[segment] + fit_period*index`, with one
+        period for the whole train and an offset per segment, and
+        `drift`, the fitted period's fractional error in ppm.
+    `residuals`: (N,) pulse times minus the fit, and `jitter`, their
+        standard deviation; `jitter_counts` and `jitter_edges` are their
+        histogram.
+    `taus`, `adev`: overlapping Allan deviation of the pulse times
+        against the nominal period, at averaging times `taus` (s),
+        over the segment with the most pulses.
+    """
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def summary(self):
+        """The scalar results, as a `dict` for tables and reports."""
+        return {
+            'pulses': len(self.times),
+            'duration': float(np.sum(self.period * np.diff(self.index)[np.diff(self.segment) == 0])),
+            'resets': len(self.resets),
+            'missed': self.missed,
+            'extra': self.extra,
+            'gaps': len(self.gaps),
+            'period': self.fit_period,
+            'drift_ppm': self.drift,
+            'jitter': self.jitter,
+            'adev_tau0': float(self.adev[0]) if len(self.adev) > 0 else np.nan,
+        }
+
+def allan_deviation(phase, tau0):
+    """
+    Overlapping Allan deviation of `phase` (time error, s) sampled every
+    `tau0` seconds, at averaging times of `tau0` times 1, 2, 4, ...
+    Samples may be nan (missing); terms touching them are left out.
+
+    Returns `(taus, adev)`.
+    """
+    n = len(phase)
+    taus = []
+    adev = []
+    m = 1
+    while 2*m < n:
+        d = phase[2*m:] - 2*phase[m:n - m] + phase[:n - 2*m]
+        d = d[np.isfinite(d)]
+        if len(d) > 0:
+            taus.append(m*tau0)
+            adev.append(np.sqrt(np.sum(d*d) / (2 * m*m * tau0*tau0 * len(d))))
+        m *= 2
+    return np.array(taus), np.array(adev)
+
+def pulse_seconds(pulses, tick=1.0):
+    """
+    Convert pulse timestamps to `np.float64` seconds from the first.
+
+    `pulses` are CdTe unixtimes (`tick=1.0`) or CMOS linetime counts
+    (`tick=cmos_tick`). Unsigned integer counters are unwrapped where
+    they roll over.
+    """
+    pulses = np.asarray(pulses)
+    if len(pulses) == 0:
+        return np.zeros(0)
+    if np.issubdtype(pulses.dtype, np.unsignedinteger):
+        steps = np.diff(pulses.astype(np.int64))
+        wrap = 1 << (8*pulses.dtype.itemsize)
+        steps[steps < -wrap//2] += wrap
+        return tick * np.concatenate(([0], np.cumsum(steps))).astype(np.float64)
+    pulses = pulses.astype(np.float64)
+    return tick * (pulses - pulses[0])
+
+def keep_pulses(t, segment, period):
+    """
+    Which pulses of the train `t` (seconds, in order) to keep, so that
+    there is at most one per period slot.
+
+    A pulse less than half a `period` after the last kept one falls in
+    the same slot, and of the two, the one closer to the slot's nominal
+    time (a whole number of periods after the kept pulse before) is
+    kept. So a glitch shortly before a real pulse is dropped, not the
+    pulse. Pulses in different `segment`s are never compared.
+
+    Returns an (N,) boolean mask.
+    """
+    keep = np.ones(len(t), dtype=bool)
+    close = np.diff(t) < period/2
+    if not np.any(close & (np.diff(segment) == 0)):
+        return keep
+    # only trains with close pulses get here; resolve them one pulse at a time:
+    times = t.tolist()
+    segments = segment.tolist()
+    last = before = None
+    for k in range(len(times)):
+        if last is None or segments[k] != segments[last]:
+            last, before = k, None
+        elif times[k] - times[last] >= period/2:
+            last, before = k, last
+        else:
+            keep[k] = False
+            if before is not None:
+                nominal = times[before] + period*max(round((times[last] - times[before]) / period), 1)
+                if abs(times[k] - nominal) < abs(times[last] - nominal):
+                    keep[last] = False
+                    keep[k] = True
+                    last = k
+    return keep
+
+def analyze_pps(pulses, tick=1.0, period=1.0, bins=50, max_gap=60.0):
+    """
+    Missed and extra pulses, clock drift, jitter and Allan deviation.
+
+    Parameters
+    ----------
+    `pulses`: (N,) pulse timestamps: CdTe unixtimes, or CMOS linetimes.
+    `tick`: seconds per unit of `pulses` (`cmos_tick` for linetimes).
+    `period`: the nominal pulse period, in seconds.
+    `bins`: number of bins for the jitter histogram.
+    `max_gap`: longest step between pulses, in seconds, still counted
+        as missed pulses.
+
+    A step backwards or of more than `max_gap` (a bad timestamp, or a
+    clock reset) can't be missed pulses, so the train is split there
+    into segments, and the step is reported in `resets` instead.
+    Within a segment, spurious pulses are dropped with `keep_pulses`,
+    and each kept pulse is assigned to a nominal second by rounding
+    the interval since the last one to whole periods, so a
+    skipped second shows up as missed pulses rather than as jitter.
+    The fit, residuals and Allan deviation all use those assignments.
+
+    Returns a `PPSAnalysis`.
+    """
+    t = pulse_seconds(pulses, tick)
+    t = t[np.isfinite(t)]
+    step = np.diff(t)
+    cuts = np.flatnonzero((step < 0) | (step > max_gap)) + 1
+    resets = t[cuts] - t[cuts - 1]
+    segment = np.zeros(len(t), dtype=np.int64)
+    segment[cuts] = 1
+    segment = np.cumsum(segment)
+
+    keep = keep_pulses(t, segment, period)
+    extra = ~keep
+    t = t[keep]
+    segment = segment[keep]
+
+    steps = np.maximum(np.rint(np.diff(t) / period).astype(np.int64), 1)
+    # the first pulse of each segment just follows on from the last one:
+    steps[np.diff(segment) != 0] = 1
+    index = np.zeros(len(t), dtype=np.int64)
+    index[1:] = np.cumsum(steps)
+    gaps = np.flatnonzero(steps > 1)
+
+    # one period for the whole train, with an offset for each segment:
+    nsegment = len(cuts) + 1 if len(t) > 0 else 0
+    counts = np.bincount(segment, minlength=nsegment)
+    index_mean = np.bincount(segment, index, nsegment) / np.maximum(counts, 1)
+    t_mean = np.bincount(segment, t, nsegment) / np.maximum(counts, 1)
+    di = index - index_mean[segment]
+    denominator = np.sum(di*di)
+    if denominator > 0:
+        fit_period = np.sum(di*(t - t_mean[segment])) / denominator
+        fit_offsets = t_mean - fit_period*index_mean
+    else:
+        fit_period, fit_offsets = np.nan, np.full(nsegment, np.nan)
+    residuals = t - (fit_offsets[segment] + fit_period*index)
+    if denominator > 0:
+        jitter_counts, jitter_edges = np.histogram(residuals, bins)
+    else:
+        jitter_counts, jitter_edges = np.zeros(bins, dtype=np.int64), np.zeros(bins + 1)
+
+    if len(t) > 0:
+        rows = segment == np.argmax(counts)
+        offset = index[rows] - index[rows][0]
+        phase = np.full(offset[-1] + 1, np.nan)
+        phase[offset] = (t[rows] - t[rows][0]) - period*offset
+    else:
+        phase = np.zeros(0)
+    taus, adev = allan_deviation(phase, period)
+
+    return PPSAnalysis(
+        times=t,
+        index=index,
+        segment=segment,
+        resets=resets,
+        period=period,
+        missed=int(np.sum(steps - 1)),
+        gaps=gaps,
+        extra=int(np.count_nonzero(extra)),
+        fit_period=float(fit_period),
+        fit_offsets=fit_offsets,
+        drift=float((fit_period - period) / period * 1e6),
+        residuals=residuals,
+        jitter=float(np.std(residuals)) if denominator > 0 else np.nan,
+        jitter_counts=jitter_counts,
+        jitter_edges=jitter_edges,
+        taus=taus,
+        adev=adev,
+    )
+
+def print_summary(path, analysis):
+    print(os.path.basename(path) + ":")
+    for key, value in analysis.summary().items():
+        print("\t{:10} {}".format(key, value))
+
+def do_cdte(path, board=3):
+    unix = cdte_pps_times(path, board)
+    print_summary(path, analyze_pps(unix))
 
-    with open(path, 'r') as f:
-        data = f.readlines()
-        unix = np.zeros(len(data)-1, dtype=np.float64)
-        for k, line in enumerate(data):
-            if k == 0: # ignore the header
-                continue
-            cols = data[k].split()
-            # if cols[2] == "1PPS" and int(cols[4]) != 0 and cols[1] == '3':
-            if cols[2] == "1PPS" and cols[1] == '3':
-                unix[k-1] = float(cols[3])
-        unix = unix[unix != 0]
-    
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12,6), sharex=True)
     fig.suptitle(os.path.basename(path))
     ax1.scatter(np.arange(0.0, len(unix), 1.0), unix, color='black')
@@ -30,26 +300,55 @@ def do_cdte(path):
 
 
 
+# CMOS telemetry frames, and where the PPS linetime is in each:
+cmos_frame_size = 0x218
+cmos_linetime_offset = 0xa4
+# seconds per linetime count:
+cmos_tick = 20.52e-6
+
+def frame_fields(path, frame_size, fields):
+    """
+    Memory-map a file of fixed-size frames and view fields in them.
+
+    Parameters
+    ----------
+    `path`: the file to map.
+    `frame_size`: bytes per frame. A trailing partial frame is ignored.
+    `fields`: a `dict` of field name to `(offset, dtype)` within a
+        frame, e.g. `{'linetime': (0xa4, '<u4')}`.
+
+    Returns a `dict` of field name to a strided (N,) array view into
+    the mapped file. Nothing is copied until the views are used, and
+    only the pages holding the fields are read.
+    """
+    size = os.path.getsize(path)
+    n = size // frame_size
+    dtype = np.dtype({
+        'names': list(fields.keys()),
+        'formats': [np.dtype(f[1]) for f in fields.values()],
+        'offsets': [f[0] for f in fields.values()],
+        'itemsize': frame_size,
+    })
+    if n == 0:
+        frames = np.zeros(0, dtype=dtype)
+    else:
+        frames = np.memmap(path, dtype=dtype, mode='r', shape=(n,))
+    return {name: frames[name] for name in fields}
+
+def cmos_linetimes(path):
+    """The little-endian PPS linetime counter from every frame of a CMOS telemetry file, as a strided `np.uint32` view."""
+    return frame_fields(path, cmos_frame_size, {'linetime': (cmos_linetime_offset, '<u4')})['linetime']
+
 def do_cmos(path):
-    with open(path, 'rb') as f:
-        data = f.read()
-        framesize = 0x218
-        length = len(data) // framesize
-        offset = 0xa4
-        linetimes = np.zeros(length, dtype = np.uint32)
-        k = 0
-        j = 0
-        while k < len(data):
-            linetimes[j] = int.from_bytes(data[k+offset:k+offset+4], byteorder='little')
-            k = k+framesize
-            j = j+1
-        
+    linetimes = cmos_linetimes(path)
+    print_summary(path, analyze_pps(linetimes, tick=cmos_tick))
+
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12,6), sharex=True)
     fig.suptitle(os.path.basename(path))
-    ax1.scatter(np.arange(0.0, len(linetimes), 1.0), 20.52e-6 * linetimes, color='black')
+    ax1.scatter(np.arange(0.0, len(linetimes), 1.0), cmos_tick * linetimes, color='black')
     ax1.set_xlabel('PPS count')
     ax1.set_ylabel('Linetime [s]')
-    ax2.scatter(np.arange(0.0, len(linetimes)-1, 1.0), 20.52e-6 * np.diff(linetimes), color='black')
+    ax2.scatter(np.arange(0.0, len(linetimes)-1, 1.0), cmos_tick * np.diff(linetimes), color='black')
     ax2.set_xlabel('PPS count')
     ax2.set_ylabel('PPS linetime differences, via telemetry [s]')
     ax2.set_ylim([0,6])
@@ -57,15 +356,146 @@ def do_cmos(path):
     plt.savefig(os.path.join(os.path.dirname(os.path.abspath(path)), 'cmos_pps.pdf'))
     plt.show()
 
+def plot_analysis(analysis, title):
+    """A 2x2 figure of a `PPSAnalysis`: intervals, fit residuals, jitter histogram and Allan deviation."""
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12,8))
+    fig.suptitle(title)
+    # intervals across a reset aren't pulse intervals:
+    within = np.diff(analysis.segment) == 0
+    ax1.plot(analysis.index[1:][within], np.diff(analysis.times)[within], ',', color='black')
+    ax1.set_xlabel('PPS count')
+    ax1.set_ylabel('Pulse interval [s]')
+    ax2.plot(analysis.period * analysis.index, 1e6 * analysis.residuals, color='black', linewidth=0.5)
+    ax2.set_xlabel('Nominal time since first pulse [s]')
+    ax2.set_ylabel('Residual from linear fit [µs]')
+    ax3.stairs(analysis.jitter_counts, 1e6 * analysis.jitter_edges, color='black')
+    ax3.set_xlabel('Residual from linear fit [µs]')
+    ax3.set_ylabel('Counts')
+    positive = analysis.adev > 0
+    if np.any(positive):
+        ax4.loglog(analysis.taus[positive], analysis.adev[positive], color='black', marker='o')
+    ax4.set_xlabel('Averaging time τ [s]')
+    ax4.set_ylabel('Overlapping Allan deviation')
+    ax4.grid(which='both', axis='both')
+    fig.tight_layout()
+    return fig
+
+def check_pps(analysis, tolerance=0.1):
+    """
+    Raise `ValueError` unless `analysis` looks like a real PPS train:
+    at least two pulses in a segment, and a median interval between
+    them within `tolerance` (fractional) of the nominal period.
+    """
+    within = np.diff(analysis.segment) == 0
+    intervals = np.diff(analysis.times)[within] / np.diff(analysis.index)[within]
+    if len(intervals) == 0:
+        raise ValueError("fewer than two pulses")
+    median = float(np.median(intervals))
+    if abs(median - analysis.period) > tolerance * analysis.period:
+        raise ValueError("median pulse interval {:g} s, not {:g} s: not a PPS log?".format(median, analysis.period))
+
+def survey_file(path, kind, board=3, figures=False):
+    """
+    Analyze one `kind` (`'cdte'` or `'cmos'`) log for `survey`, and
+    optionally save its `plot_analysis` figure next to it, as
+    `<file name>_pps.pdf`.
+
+    File name patterns can catch logs that hold no PPS data, so a CMOS
+    file that isn't a whole number of frames, or any log that fails
+    `check_pps`, gets an error instead of statistics.
+
+    Returns a `dict` row: `file`, `kind`, the `PPSAnalysis.summary()`
+    values, and `error`, which holds the message if analysis failed.
+    """
+    row = {'file': path, 'kind': kind, 'error': ''}
+    try:
+        if kind == 'cdte':
+            analysis = analyze_pps(cdte_pps_times(path, board))
+        else:
+            size = os.path.getsize(path)
+            if size % cmos_frame_size != 0:
+                raise ValueError("{} bytes is not a whole number of {}-byte CMOS frames".format(size, cmos_frame_size))
+            analysis = analyze_pps(cmos_linetimes(path), tick=cmos_tick)
+        check_pps(analysis)
+        row.update(analysis.summary())
+        if figures:
+            plt.switch_backend('agg')
+            fig = plot_analysis(analysis, os.path.basename(path))
+            fig.savefig(path + '_pps.pdf')
+            plt.close(fig)
+    except Exception as e:
+        row['error'] = repr(e)
+    return row
+
+def find_pps_logs(root, cdte_pattern='*cdte*', cmos_pattern='*cmos*'):
+    """Every file under `root` whose name matches `cdte_pattern` or `cmos_pattern` (case-insensitive), as `(path, kind)` pairs."""
+    result = []
+    for folder, dirs, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            lower = name.lower()
+            if lower.endswith('.pdf') or lower.endswith('.csv'):
+                continue
+            if fnmatch.fnmatch(lower, cdte_pattern.lower()):
+                result.append((os.path.join(folder, name), 'cdte'))
+            elif fnmatch.fnmatch(lower, cmos_pattern.lower()):
+                result.append((os.path.join(folder, name), 'cmos'))
+    return result
+
+def survey(root, board=3, figures=False, workers=None, cdte_pattern='*cdte*', cmos_pattern='*cmos*'):
+    """
+    Analyze every CdTe and CMOS log under `root` (see `find_pps_logs`)
+    on a pool of `workers` processes (by default, one per CPU), and
+    write one row per file to `pps_summary.csv` in `root`. With
+    `figures`, each file's figure is also saved, headless.
+
+    Returns the rows, in file order.
+    """
+    logs = find_pps_logs(root, cdte_pattern, cmos_pattern)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    jobs = ([path for path, _ in logs], [kind for _, kind in logs], [board]*len(logs), [figures]*len(logs))
+    if workers < 2 or len(logs) < 2:
+        rows = list(map(survey_file, *jobs))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(survey_file, *jobs))
+
+    columns = ['file', 'kind', 'pulses', 'duration', 'resets', 'missed', 'extra', 'gaps', 'period', 'drift_ppm', 'jitter', 'adev_tau0', 'error']
+    with open(os.path.join(root, 'pps_summary.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+def print_survey(rows, root):
+    print("{:50} {:5} {:>8} {:>6} {:>7} {:>6} {:>6} {:>12} {:>12}".format('file', 'kind', 'pulses', 'resets', 'missed', 'extra', 'gaps', 'drift [ppm]', 'jitter [µs]'))
+    for row in rows:
+        name = os.path.relpath(row['file'], root)
+        if row['error']:
+            print("{:50} {:5} {}".format(name, row['kind'], row['error']))
+            continue
+        print("{:50} {:5} {:8} {:6} {:7} {:6} {:6} {:12.3f} {:12.3f}".format(
+            name, row['kind'], row['pulses'], row['resets'], row['missed'], row['extra'], row['gaps'], row['drift_ppm'], 1e6 * row['jitter']
+        ))
+
+# command line argument setup
+parser = argparse.ArgumentParser("pps.py")
+parser.add_argument("mode", choices=["cdte", "cmos", "survey"], help="analyze one CdTe or CMOS log, or survey every log under a folder")
+parser.add_argument("path", help="log file, or folder for survey")
+parser.add_argument("board", nargs="?", type=int, default=3, help="CdTe board number (default 3)")
+parser.add_argument("--figures", action="store_true", help="survey: save a figure next to each log")
+parser.add_argument("--workers", type=int, default=None, help="survey: number of worker processes (default: one per CPU)")
+parser.add_argument("--cdte-pattern", default="*cdte*", help="survey: file name pattern for CdTe logs (default *cdte*)")
+parser.add_argument("--cmos-pattern", default="*cmos*", help="survey: file name pattern for CMOS logs (default *cmos*)")
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("run like this\n\t> python pps.py cdte|cmos path/to/log/file.log")
-        sys.exit(1)
-
-    if sys.argv[1] == "cdte":
-        do_cdte(sys.argv[2])
-    elif sys.argv[1] == "cmos":
-        do_cmos(sys.argv[2])
+    args = parser.parse_args()
+
+    if args.mode == "cdte":
+        do_cdte(args.path, args.board)
+    elif args.mode == "cmos":
+        do_cmos(args.path)
     else:
-        print("you were supposed to say cdte or cmos")
-        sys.exit(1)
+        rows = survey(args.path, args.board, args.figures, args.workers, args.cdte_pattern, args.cmos_pattern)
+        print_survey(rows, args.path)
+        print("wrote", os.path.join(args.path, 'pps_summary.csv'))
@@ -0,0 +1,160 @@
+import socket, os, sys, time
+import argparse
+
+import numpy as np
+
+from rtd import frame_dtype, frame_size
+from rtddebug import mcast_group, mcast_port, rtd_offset, housekeeping_system, rtd_type, pow_type, pow_frame_size
+
+# Packets are an 8-byte header followed by one log frame, so that an
+# RTD frame's chip byte lands at data[8] and its channel words at
+# `rtd_offset`, where rtddebug looks for them.
+header_size = rtd_offset - 6
+
+default_local_ip = "127.0.0.1"
+default_pow_period = 1.0
+
+# command line argument setup
+parser = argparse.ArgumentParser("replay.py")
+parser.add_argument("paths", nargs="+", help="session folders (holding housekeeping_rtd.log and/or housekeeping_pow.log) or log files to replay, in order")
+parser.add_argument("--local-ip", help="Interface to send multicast from (default " + default_local_ip + ")", type=str, default=default_local_ip)
+parser.add_argument("--port", help="Multicast port (default " + str(mcast_port) + ")", type=int, default=mcast_port)
+parser.add_argument("--speed", help="Replay this many times faster than recorded (default 1)", type=float, default=1.0)
+parser.add_argument("--max", help="Send as fast as possible, ignoring recorded timing", action="store_true")
+parser.add_argument("--pow-period", help="Seconds between power frames when there is no RTD log to pace them by (default " + str(default_pow_period) + ")", type=float, default=default_pow_period)
+
+
+def packets(frames, type: int, keys=None):
+    """Prefix each row of (N, frame length) `frames` with a packet header of `type`.
+
+    Bytes 1-4 of the header hold a big-endian count of the packets in
+    this stream, so receivers can spot losses. If (N,) `keys` are given
+    (e.g. RTD chip numbers), each key is counted separately. Returns an
+    (N, length) `np.uint8` array.
+    """
+    counter = np.arange(len(frames), dtype=">u4")
+    if keys is not None:
+        for key in np.unique(keys):
+            rows = np.flatnonzero(keys == key)
+            counter[rows] = np.arange(len(rows))
+    out = np.zeros((len(frames), header_size + frames.shape[1]), dtype=np.uint8)
+    out[:, 0] = housekeeping_system
+    out[:, 1:5] = counter.view(np.uint8).reshape(-1, 4)
+    out[:, 5] = type
+    out[:, header_size:] = frames
+    return out
+
+
+def read_frames(file: str, size: int):
+    """The whole `size`-byte frames in `file`, as an (N, `size`) `np.uint8` array."""
+    raw = np.fromfile(file, dtype=np.uint8)
+    return raw[: len(raw) - len(raw) % size].reshape(-1, size)
+
+
+def load_session(paths: list[str], pow_period: float):
+    """
+    Build the packets to replay from one session's logs.
+
+    RTD frames are sent at their recorded unixtimes. Power frames are
+    spread evenly over the RTD log's span (the two are written side by
+    side during a session), or sent every `pow_period` seconds if
+    there is no RTD log.
+
+    Returns `(times, packets)`: seconds from the start of the session
+    to send each packet at, in order, and a `list` of packet `bytes`.
+    """
+    streams = []
+    span = None
+    for path in paths:
+        if os.path.basename(path) == "housekeeping_pow.log":
+            continue
+        frames = read_frames(path, frame_size)
+        if len(frames) == 0:
+            continue
+        unixtime = frames.reshape(-1).view(frame_dtype)["unixtime"].astype(np.float64)
+        times = unixtime - unixtime.min()
+        span = times.max() + 1
+        streams.append((times, packets(frames, rtd_type, keys=frames[:, 0])))
+    for path in paths:
+        if os.path.basename(path) != "housekeeping_pow.log":
+            continue
+        frames = read_frames(path, pow_frame_size)
+        if len(frames) == 0:
+            continue
+        period = span / len(frames) if span is not None else pow_period
+        streams.append((np.arange(len(frames)) * period, packets(frames, pow_type)))
+
+    if len(streams) == 0:
+        return np.zeros(0), []
+    times = np.concatenate([t for t, _ in streams])
+    order = np.argsort(times, kind="stable")
+    rows = [row for _, stream in streams for row in stream]
+    return times[order], [rows[k].tobytes() for k in order]
+
+
+def find_sessions(paths: list[str]):
+    """Group the logs under `paths` by session folder, in order."""
+    sessions = []
+    for path in paths:
+        if os.path.isfile(path):
+            sessions.append([path])
+            continue
+        for root, dirs, files in sorted(os.walk(path)):
+            logs = [os.path.join(root, name) for name in ("housekeeping_rtd.log", "housekeeping_pow.log") if name in files]
+            if logs:
+                sessions.append(logs)
+    return sessions
+
+
+def replay(sock: socket.socket, address, times, packets: list[bytes], speed: float|None):
+    """
+    Send `packets` to `address`, each `times[k] / speed` seconds after
+    starting (or back to back if `speed` is `None`). Prints the send
+    rate every second. Returns `(packets sent, bytes sent, seconds)`.
+    """
+    start = time.perf_counter()
+    last_report = start
+    reported = 0
+    nbytes = 0
+    due = times / speed if speed is not None else None
+    for k, data in enumerate(packets):
+        if due is not None:
+            wait = start + due[k] - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        sock.sendto(data, address)
+        nbytes += len(data)
+        now = time.perf_counter()
+        if now - last_report >= 1.0:
+            print("{:10.0f} packets/s  {:8} of {} sent".format((k + 1 - reported) / (now - last_report), k + 1, len(packets)))
+            last_report = now
+            reported = k + 1
+    return len(packets), nbytes, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(args.local_ip))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    # keep replayed traffic on the local network:
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    address = (mcast_group, args.port)
+    speed = None if args.max else args.speed
+
+    total = [0, 0, 0.0]
+    try:
+        for logs in find_sessions(args.paths):
+            times, session = load_session(logs, args.pow_period)
+            print("replaying", len(session), "packets from", ", ".join(logs))
+            sent, nbytes, elapsed = replay(sock, address, times, session, speed)
+            total = [total[0] + sent, total[1] + nbytes, total[2] + elapsed]
+    except KeyboardInterrupt:
+        pass
+
+    sent, nbytes, elapsed = total
+    if elapsed > 0:
+        print("sent {} packets ({:.1f} MB) in {:.2f} s: {:.0f} packets/s, {:.1f} MB/s".format(
+            sent, nbytes / 1e6, elapsed, sent / elapsed, nbytes / 1e6 / elapsed
+        ))
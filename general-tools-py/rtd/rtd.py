@@ -1,4 +1,5 @@
-import sys, os, datetime, re
+import sys, os, datetime, re, bisect, hashlib
+import concurrent.futures, functools
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
@@ -38,23 +39,496 @@ flag_values = {
     1 << 6: "ADC hard fault",
     1 << 7: "sensor hard fault"
 }
+# each flag bit, in `flag_values` order:
+flag_bits = np.array(list(flag_values.keys()), dtype=np.uint8)
+# a hard fault means there was no conversion, so these can't come with "valid":
+hard_fault_bits = (1 << 5) | (1 << 6) | (1 << 7)
 
 ranges = {
     1: (-30,60),
     2: (21, 24)
 }
 
+# layout of one 42-byte frame in housekeeping_rtd.log. Each of the
+# 9 `data` words holds a flag byte followed by a 24-bit two's
+# complement temperature in units of 1/1024 ºC.
+frame_dtype = np.dtype([
+    ('chip', 'u1'),
+    ('reserved', 'u1'),
+    ('unixtime', '>u4'),
+    ('data', '>i4', (9,)),
+])
+frame_size = frame_dtype.itemsize
+
+def sign_extend(words, out=None):
+    """
+    Sign-extend the 24-bit two's complement value in the lower 3
+    bytes of each 32-bit word (the top byte, the flag, is dropped).
+
+    Parameters
+    ----------
+    `words`: an array of 32-bit channel words, any shape or byte order.
+    `out`: optional `np.int32` array of the same shape to write into,
+        so that no new array is allocated.
+
+    Returns the `np.int32` raw temperatures, in units of 1/1024 ºC.
+    """
+    if out is None:
+        out = np.empty(np.shape(words), dtype=np.int32)
+    np.copyto(out, words, casting='unsafe')
+    # shift the 24-bit value to the top of the word, then back down
+    # arithmetically so the sign bit is extended:
+    np.left_shift(out, 8, out=out)
+    np.right_shift(out, 8, out=out)
+    return out
+
+def decode_words(words):
+    """
+    Split raw RTD channel words into flags and temperatures.
+
+    Parameters
+    ----------
+    `words`: an array of 32-bit big-endian channel words, any shape.
+
+    Returns a tuple `(flags, temps)` of the same shape as `words`:
+    the `np.uint8` flag from the top byte, and the `np.float32`
+    temperature in ºC from the sign-extended lower 24 bits.
+    """
+    words = np.asarray(words).astype(np.int32)
+    flags = ((words >> 24) & 0xff).astype(np.uint8)
+    temps = sign_extend(words).astype(np.float32) / 1024
+    return flags, temps
+
+def decode_frames(frames):
+    """
+    Decode an array of RTD frames into columns.
+
+    Parameters
+    ----------
+    `frames`: a structured array with dtype `frame_dtype`, or a
+    `bytes`-like buffer holding whole 42-byte frames (any trailing
+    partial frame is ignored).
+
+    Returns a `dict` of arrays with one row per frame:
+        `'chip'`:       `np.uint8`, shape (N,)
+        `'unixtime'`:   `np.uint32`, shape (N,)
+        `'flag'`:       `np.uint8`, shape (N, 9)
+        `'temp'`:       `np.float32`, shape (N, 9), in ºC
+    """
+    if not isinstance(frames, np.ndarray):
+        frames = np.frombuffer(frames, dtype=frame_dtype, count=len(frames) // frame_size)
+    flags, temps = decode_words(frames['data'])
+    return {
+        'chip': frames['chip'].astype(np.uint8),
+        'unixtime': frames['unixtime'].astype(np.uint32),
+        'flag': flags,
+        'temp': temps,
+    }
+
+def scan_frames(data, frame_size: int, valid, chunk: int = 1 << 22):
+    """
+    Find where whole, valid frames start in a log of fixed-size
+    frames that may have dropped or extra bytes in it.
+
+    Parameters
+    ----------
+    `data`: a `bytes`-like buffer (or `np.uint8` array) of the log.
+    `frame_size`: the size of one frame in bytes.
+    `valid`: a function `valid(buffer, first, last)` that takes the log
+        as a `np.uint8` array and a range of candidate byte offsets,
+        and returns a boolean array saying whether a plausible frame
+        starts at each offset in the range. `rtd_frame_valid` is one
+        for RTD logs.
+    `chunk`: how many candidate offsets to check at once, to bound
+        memory use on large logs.
+
+    Every byte offset is checked at once with `valid`. Then, from the
+    start of the log, runs of valid frames are taken one stride at a
+    time, and any bytes between runs are skipped up to the next offset
+    where a valid frame starts.
+
+    Returns a tuple `(offsets, skipped)`: a `np.int64` array of the
+    byte offset of each frame found, in order, and a `list` of
+    `(start, stop)` byte ranges that were not part of any frame.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    candidates = len(buffer) - frame_size + 1
+    if candidates <= 0:
+        return np.zeros(0, dtype=np.int64), ([(0, len(buffer))] if len(buffer) > 0 else [])
+
+    ok = np.concatenate([
+        valid(buffer, first, min(first + chunk, candidates))
+        for first in range(0, candidates, chunk)
+    ])
+    good = np.flatnonzero(ok)
+
+    runs = []
+    skipped = []
+    position = 0
+    while position < candidates:
+        if not ok[position]:
+            following = np.searchsorted(good, position)
+            resume = good[following] if following < len(good) else len(buffer)
+            skipped.append((int(position), int(resume)))
+            position = int(resume)
+            continue
+        # count consecutive valid frames from here, looking further ahead each time
+        length = 0
+        block = 1024
+        while True:
+            run = ok[position + length*frame_size::frame_size][:block]
+            bad = np.flatnonzero(~run)
+            if len(bad) > 0:
+                length += bad[0]
+                break
+            length += len(run)
+            if len(run) < block:
+                break
+            block *= 2
+        runs.append(position + frame_size*np.arange(length, dtype=np.int64))
+        position += frame_size*length
+
+    if position < len(buffer):
+        skipped.append((position, len(buffer)))
+    offsets = np.concatenate(runs) if len(runs) > 0 else np.zeros(0, dtype=np.int64)
+    return offsets, skipped
+
+def rtd_frame_valid(buffer, first: int, last: int, max_step: int = 60):
+    """
+    Plausibility check for RTD frames starting at each byte offset
+    from `first` up to `last` in `buffer`, for use with `scan_frames`.
+
+    A frame is plausible if its chip byte is `1` or `2`, if no
+    channel flag has the "valid" bit set alongside a hard fault bit
+    (`hard_fault_bits`; soft faults and range bits can accompany a
+    valid reading), and if the frame just before or just after it is
+    also plausible and has a unixtime no more than `max_step` seconds
+    away (and not going backwards).
+    """
+    # work on every offset from one frame before `first` to one frame
+    # after `last`, so neighbours can be compared by shifting:
+    low = max(first - frame_size, 0)
+    count = min(last + frame_size, len(buffer) - frame_size + 1) - low
+
+    def field(offset):
+        return buffer[low + offset:low + offset + count]
+
+    chip = field(0)
+    ok = (chip == 1) | (chip == 2)
+    for channel in range(9):
+        flag = field(6 + 4*channel)
+        ok &= ((flag & 1) == 0) | ((flag & hard_fault_bits) == 0)
+
+    unixtime = np.zeros(count, dtype=np.int64)
+    for byte in range(4):
+        unixtime = (unixtime << 8) | field(2 + byte)
+
+    step = unixtime[frame_size:] - unixtime[:-frame_size]
+    pair = ok[frame_size:] & ok[:-frame_size] & (step >= 0) & (step <= max_step)
+    neighbours = np.zeros(count, dtype=bool)
+    neighbours[:-frame_size] |= pair
+    neighbours[frame_size:] |= pair
+    # a log holding a single frame has no neighbours to check against:
+    if len(buffer) < 2*frame_size:
+        neighbours[:] = True
+    return (ok & neighbours)[first - low:last - low]
+
+class RTDSamples:
+    """
+    Compact, growable store of the measurements from one RTD chip.
+
+    Holds a `np.uint32` unixtime per sample, plus (N, 9) `np.uint8`
+    flags and `np.float32` temperatures (ºC), which is 49 bytes per
+    sample. The backing arrays grow by doubling, so `append` and
+    `extend` are constant time per sample (amortized). The
+    `unixtime`, `flag` and `temp` properties are views of the
+    filled part of the arrays.
+    """
+    __slots__ = ('_unixtime', '_flag', '_temp', '_count')
+
+    def __init__(self, capacity: int = 0):
+        self._unixtime = np.zeros(capacity, dtype=np.uint32)
+        self._flag = np.zeros((capacity, 9), dtype=np.uint8)
+        self._temp = np.zeros((capacity, 9), dtype=np.float32)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def unixtime(self):
+        return self._unixtime[:self._count]
+
+    @property
+    def flag(self):
+        return self._flag[:self._count]
+
+    @property
+    def temp(self):
+        return self._temp[:self._count]
+
+    def __getstate__(self):
+        # only send the filled part of the arrays when pickled (e.g. between processes)
+        return self.unixtime.copy(), self.flag.copy(), self.temp.copy()
+
+    def __setstate__(self, state):
+        self._unixtime, self._flag, self._temp = state
+        self._count = len(self._unixtime)
+
+    def reserve(self, capacity: int):
+        """Grow the backing arrays to hold at least `capacity` samples."""
+        if capacity <= len(self._unixtime):
+            return
+        capacity = max(capacity, 2*len(self._unixtime))
+        for name in ('_unixtime', '_flag', '_temp'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, name, new)
+
+    def append(self, unixtime: int, flag, temp):
+        """Add one sample: a unixtime and 9 flags and temperatures."""
+        self.reserve(self._count + 1)
+        self._unixtime[self._count] = unixtime
+        self._flag[self._count] = flag
+        self._temp[self._count] = temp
+        self._count += 1
+
+    def extend(self, unixtime, flag, temp):
+        """Add N samples from arrays of shape (N,), (N, 9) and (N, 9)."""
+        n = len(unixtime)
+        self.reserve(self._count + n)
+        self._unixtime[self._count:self._count + n] = unixtime
+        self._flag[self._count:self._count + n] = flag
+        self._temp[self._count:self._count + n] = temp
+        self._count += n
+
+class MappedLog:
+    def __init__(self, file: str, resync: bool = False):
+        """
+        Memory-map the RTD log `file` without reading it.
+
+        Parameters
+        ----------
+        `file`: a path to a `housekeeping_rtd.log` file.
+        `resync`: if `True`, scan the whole log with `scan_frames` for
+            frame boundaries instead of assuming a frame every 42
+            bytes from the start. Use this for logs with dropped or
+            extra bytes.
+
+        `self.frames` is a zero-copy structured view (dtype
+        `frame_dtype`) over every whole frame in the file. Bytes
+        are only read from disk when frames are actually touched,
+        so opening a large log costs the same as opening a small
+        one. Any trailing partial frame is left out. `self.end` is
+        the byte offset just past the last whole frame.
+
+        With `resync`, `self.frames` holds the frames found by the
+        scan: still a view if they form one contiguous run, otherwise
+        a copy joined from a view of each run. `self.skipped` lists the
+        `(start, stop)` byte ranges that were left out.
+
+        Time lookups assume the `unixtime` field never decreases
+        through the file, which is how the GSE writes it.
+        """
+        self.name = file
+        self.skipped = []
+        size = os.path.getsize(file)
+        if size == 0:
+            # np.memmap refuses to map an empty file
+            self.frames = np.zeros(0, dtype=frame_dtype)
+            self.end = 0
+        elif resync:
+            buffer = np.memmap(file, dtype=np.uint8, mode='r', shape=(size,))
+            offsets, self.skipped = scan_frames(buffer, frame_size, rtd_frame_valid)
+            # view each contiguous run of frames in place, so only the
+            # frames themselves are copied (and not at all if there is one run):
+            breaks = np.flatnonzero(np.diff(offsets) != frame_size) + 1
+            bounds = np.concatenate(([0], breaks, [len(offsets)]))
+            runs = [
+                np.frombuffer(buffer, dtype=frame_dtype, count=int(stop - start), offset=int(offsets[start]))
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+            ]
+            if len(runs) == 0:
+                self.frames = np.zeros(0, dtype=frame_dtype)
+            elif len(runs) == 1:
+                self.frames = runs[0]
+            else:
+                self.frames = np.concatenate(runs)
+            self.end = int(offsets[-1]) + frame_size if len(offsets) > 0 else 0
+        else:
+            count = size // frame_size
+            self.frames = np.memmap(file, dtype=frame_dtype, mode='r', shape=(count,)) if count > 0 else np.zeros(0, dtype=frame_dtype)
+            self.end = count * frame_size
+
+    def __len__(self):
+        return len(self.frames)
+
+    def span(self):
+        """
+        Return the `(first, last)` unixtime in the file, or `None`
+        if there are no frames. Only touches two frames.
+        """
+        if len(self.frames) == 0:
+            return None
+        return int(self.frames[0]['unixtime']), int(self.frames[-1]['unixtime'])
+
+    def index(self, unixtime: int):
+        """
+        Binary search for the first frame with a `unixtime` at or
+        after `unixtime`. Touches O(log N) frames.
+        """
+        return bisect.bisect_left(self.frames['unixtime'], unixtime)
+
+    def decode(self, start: int|None = None, stop: int|None = None):
+        """
+        Decode only the frames with `start <= unixtime < stop`.
+
+        Parameters
+        ----------
+        `start`: first unixtime to include, or `None` for the start of the file.
+        `stop`: unixtime to stop before, or `None` for the end of the file.
+
+        Returns the same `dict` of columns as `decode_frames`.
+        """
+        first = 0 if start is None else self.index(start)
+        last = len(self.frames) if stop is None else self.index(stop)
+        return decode_frames(self.frames[first:max(first, last)])
+
+class ParseCache:
+    def __init__(self, directory: str|None = None, max_bytes: int = 1 << 30, hash_bytes: int = 1 << 16):
+        """
+        On-disk cache of decoded housekeeping log columns.
+
+        Parameters
+        ----------
+        `directory`: folder to keep cache entries in. Defaults to the
+            `GENERAL_TOOLS_CACHE` environment variable, or else
+            `~/.cache/general-tools`.
+        `max_bytes`: total size the cache may grow to before the least
+            recently used entries are deleted.
+        `hash_bytes`: how many bytes from the start of each log are
+            hashed to check that an entry still matches its log.
+
+        Each entry is an `.npz` file of named arrays for one log. An
+        entry is only used if the log's size, mtime and the hash of
+        its first `hash_bytes` all still match, so logs that are
+        appended to or replaced are decoded again.
+        """
+        if directory is None:
+            directory = os.environ.get('GENERAL_TOOLS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'general-tools'))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_bytes = hash_bytes
+
+    def entry(self, file: str, variant: str = ''):
+        """Path of the cache entry for `file` (and `variant`, e.g. a time slice)."""
+        key = hashlib.sha1((os.path.abspath(file) + '|' + variant).encode()).hexdigest()
+        return os.path.join(self.directory, key + '.npz')
+
+    def signature(self, file: str):
+        """Size, mtime and head hash of `file`, as an array to store alongside the data."""
+        stat = os.stat(file)
+        with open(file, 'rb') as source:
+            head = hashlib.sha1(source.read(self.hash_bytes)).hexdigest()
+        return np.array([str(stat.st_size), str(stat.st_mtime_ns), head])
+
+    def load(self, file: str, variant: str = ''):
+        """
+        Return the `dict` of arrays cached for `file`, or `None` if
+        there is no entry or the entry is out of date.
+        """
+        entry = self.entry(file, variant)
+        try:
+            with np.load(entry, allow_pickle=False) as stored:
+                if not np.array_equal(stored['_signature'], self.signature(file)):
+                    raise ValueError
+                arrays = {name: stored[name] for name in stored.files if name != '_signature'}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            # stale or unreadable entry
+            self.remove(entry)
+            return None
+        # mark as recently used, for eviction
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # evicted by another process since it was read; the arrays are still good
+            pass
+        return arrays
+
+    def store(self, file: str, arrays: dict, variant: str = '', signature=None):
+        """
+        Save the `dict` of arrays decoded from `file`, then trim the cache.
+
+        If `file` may be growing, pass the `signature` taken before it
+        was decoded, so the entry can't claim bytes it doesn't hold.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entry = self.entry(file, variant)
+        if signature is None:
+            signature = self.signature(file)
+        partial = entry + '.' + str(os.getpid()) + '.tmp'
+        with open(partial, 'wb') as sink:
+            np.savez(sink, _signature=signature, **arrays)
+        os.replace(partial, entry)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in `self.max_bytes`."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, entry: str):
+        try:
+            os.remove(entry)
+        except FileNotFoundError:
+            pass
+
 class Parser:
-    def __init__(self, file: str):
+    def __init__(self, file: str, start: int|None = None, stop: int|None = None, cache: ParseCache|None = None, resync: bool = False):
         """
         Parse RTD data from the provided `file`.
 
         Parameters
         ----------
         `file`: a path to the file that should be parsed.
+        `start`: if given, skip frames with a unixtime before this.
+        `stop`: if given, skip frames with a unixtime at or after this.
+        `cache`: if given, a `ParseCache` to reuse decoded columns from
+            (and save them to) instead of decoding the file every time.
+        `resync`: if `True`, find frame boundaries with `scan_frames`
+            so that a log with dropped or extra bytes can still be
+            parsed. Skipped byte ranges are stored in `self.skipped`.
 
-        Populates a field called `self.rtd_data`, which is
-        a poorly-designed nested `dict`. `self.rtd_data` has
+        `self.offset` is the byte offset just past the last whole
+        frame in the file when it was parsed. Call `update()` to
+        decode frames appended to the file after that.
+
+        The file is memory-mapped with `MappedLog`, and only the
+        frames between `start` and `stop` are read from disk and
+        decoded at once with `decode_frames`. The measurements
+        are stored in `self.samples`, a `dict` with an
+        `RTDSamples` for each RTD chip on the Housekeeping board
+        (keys `1` and `2`).
+
+        For older code there is also `self.rtd_data`, which is
+        a poorly-designed nested `dict`. It is built from
+        `self.samples` the first time it is accessed. `self.rtd_data` has
         two top-level keys, one per RTD chip on the Housekeeping
         board. These are `1` and `2`. The value for each top-
         level key is a `list` of `dict`s for each measurement.
@@ -96,47 +570,88 @@ class Parser:
         }
         """
 
-        frame_size = 42
         self.name = file
         self.start = None
+        self._rtd_data = None
 
         print("parsing", file, "...")
 
-        with open(file, 'rb') as source:
+        self.skipped = []
+        columns = None
+        if cache is not None:
+            variant = 'rtd ' + str(start) + ':' + str(stop) + (' resync' if resync else '')
+            signature = cache.signature(file)
+            columns = cache.load(file, variant)
+            if columns is not None:
+                self.offset = int(columns.pop('offset'))
+                self.skipped = [tuple(skip) for skip in columns.pop('skipped').tolist()]
+        if columns is None:
+            log = MappedLog(file, resync)
+            self.offset = log.end
+            self.skipped = log.skipped
+            columns = log.decode(start, stop)
+            if cache is not None:
+                cache.store(file, dict(columns, offset=self.offset, skipped=np.array(self.skipped, dtype=np.int64).reshape(-1, 2)), variant, signature)
+
+        if len(self.skipped) > 0:
+            print("skipped", sum(last - first for first, last in self.skipped), "bytes in", len(self.skipped), "places")
+
+        self.samples = {chip: RTDSamples() for chip in [1,2]}
+        self.append(columns)
+
+        self.detect_datetime()
+
+    def append(self, columns: dict):
+        """Add decoded columns (from `decode_frames`) to `self.samples`."""
+        for chip in self.samples:
+            rows = columns['chip'] == chip
+            self.samples[chip].extend(columns['unixtime'][rows], columns['flag'][rows], columns['temp'][rows])
+        self._rtd_data = None
+
+    def update(self):
+        """
+        Decode whole frames appended to the file since it was last
+        read, and add them to `self.samples`. A partial frame at the
+        end of the file is left for the next call. Returns the
+        number of new frames.
+
+        Only the new bytes are read, so calling this regularly on a
+        log the GSE is still writing costs the same however long the
+        log gets.
+        """
+        with open(self.name, 'rb') as source:
+            source.seek(self.offset)
             data = source.read()
+        count = len(data) // frame_size
+        if count == 0:
+            return 0
+        self.append(decode_frames(data))
+        self.offset += count * frame_size
+        return count
 
+    @property
+    def rtd_data(self):
+        """
+        The nested `dict` view of the parsed data described in
+        `__init__`. Built on first access, then cached.
+        """
+        if self._rtd_data is None:
             # a key for each RTD chip on the Housekeeping board
             output = {1:[], 2:[]}
-
-            for block in range(len(data) // frame_size):
-                # an index back into source `data`:
-                global_index = block*frame_size
-
-                # each frame will have an associated `unixtime` and `data`
-                # (`data` stores the error and raw data from the measurement)
-                inner_structure = {
-                    'unixtime': data[global_index+2:global_index+6],
-                    'data': {}
-                }
-                # actual data (not `unixtime`) starts 6 bytes into the frame
-                local_offset = 6
-                
-                for local_index in range(9):
-                    this_index = global_index + local_offset + local_index*4
-                    # a flag value != 1 is cause to suspect the measurement
-                    this_flag = data[this_index]
-                    # convert the temperature from raw to º Celsius
-                    this_temp_raw = int.from_bytes(data[this_index + 1:this_index + 4], 'big')
-                    if this_temp_raw & (1 << 23):
-                        this_temp_raw = (~this_temp_raw & 0xffffff)
-                        this_temp_raw = -this_temp_raw + 1
-                    this_temp = this_temp_raw / 1024
-                    # store the flag and temperature data:
-                    inner_structure['data'][local_index] = {'flag': this_flag, 'temp': this_temp}
-                output[data[global_index]].append(inner_structure)
-
-            self.rtd_data = output
-            self.detect_datetime()
+            for chip in output:
+                samples = self.samples[chip]
+                unixtimes = samples.unixtime.astype('>u4').tobytes()
+                flags = samples.flag.tolist()
+                temps = samples.temp.tolist()
+                for k in range(len(samples)):
+                    output[chip].append({
+                        'unixtime': unixtimes[4*k:4*k + 4],
+                        'data': {
+                            ch: {'flag': flags[k][ch], 'temp': temps[k][ch]} for ch in range(9)
+                        }
+                    })
+            self._rtd_data = output
+        return self._rtd_data
 
     def detect_datetime(self):
         """
@@ -159,27 +674,419 @@ class Parser:
             print("couldn't infer datetime")
             self.start = None
 
+class FlagStats:
+    """
+    Counts of each `flag_values` bit on each channel in windows of
+    time, as computed by `flag_stats`.
+
+    `start`: (W,) start of each window, in the same units as the input
+        times (`np.datetime64`, or seconds).
+    `window`: length of each window, in seconds.
+    `counts`: (W, 8, 9) number of samples in each window with each
+        flag bit set, per channel.
+    `samples`: (W,) number of samples in each window.
+    """
+    def __init__(self, start, window: float, counts, samples):
+        self.start = start
+        self.window = window
+        self.counts = counts
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def center(self):
+        """(W,) middle of each window."""
+        if np.issubdtype(self.start.dtype, np.datetime64):
+            return self.start + np.timedelta64(int(self.window*5e5), 'us')
+        return self.start + self.window/2
+
+    @property
+    def rates(self):
+        """(W, 8, 9) flag bits set per second."""
+        return self.counts / self.window
+
+    @property
+    def fractions(self):
+        """(W, 8, 9) fraction of samples with each flag bit set, nan for empty windows."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.counts / self.samples[:, None, None]
+
+    @property
+    def error_rate(self):
+        """(W,) total error bits (any bit but "valid") set per second, over all channels."""
+        return self.counts[:, 1:, :].sum(axis=(1,2)) / self.window
+
+    def total(self, start=None, stop=None):
+        """(8, 9) counts summed over the windows starting in [`start`, `stop`)."""
+        first = 0 if start is None else np.searchsorted(self.start, start)
+        last = len(self) if stop is None else np.searchsorted(self.start, stop)
+        return self.counts[first:last].sum(axis=0)
+
+def flag_stats(times, flags, window: float, step: float|None = None):
+    """
+    Count flag bits per channel over windows of time.
+
+    Parameters
+    ----------
+    `times`: (N,) sample times, as `np.datetime64` or seconds. To
+        combine several sessions, pass a list of arrays, one per session.
+    `flags`: (N, 9) flag bytes (`RTDSamples.flag`), or a list of them
+        matching `times`.
+    `window`: window length, in seconds.
+    `step`: seconds from the start of one window to the next. By
+        default this is `window` (tumbling windows). For sliding
+        windows, use a `step` that `window` is a whole multiple of.
+
+    Samples are binned once into `step`-long bins, and each window
+    sums `window/step` consecutive bins, so sliding windows cost no
+    more than tumbling ones. Windows start at the earliest sample.
+
+    Returns a `FlagStats`.
+    """
+    if isinstance(times, (list, tuple)):
+        times = np.concatenate(times) if len(times) > 0 else np.zeros(0)
+        flags = np.concatenate(flags) if len(flags) > 0 else np.zeros((0, 9), dtype=np.uint8)
+    times = np.asarray(times)
+    flags = np.asarray(flags, dtype=np.uint8)
+    if step is None:
+        step = window
+    per_window = int(round(window / step))
+    if per_window < 1 or not np.isclose(per_window*step, window):
+        raise ValueError("window must be a whole multiple of step")
+
+    if len(times) == 0:
+        return FlagStats(times[:0], window, np.zeros((0, len(flag_bits), flags.shape[-1]), dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    datetimes = np.issubdtype(times.dtype, np.datetime64)
+    if datetimes:
+        times = times.astype('datetime64[us]')
+    origin = times.min()
+    seconds = (times - origin) / np.timedelta64(1, 's') if datetimes else (times - origin).astype(np.float64)
+    if np.any(np.diff(seconds) < 0):
+        order = np.argsort(seconds, kind='stable')
+        seconds = seconds[order]
+        flags = flags[order]
+
+    bins = (seconds // step).astype(np.int64)
+    nbins = int(bins[-1]) + 1
+    # first sample in each bin (the next bin's, for empty bins):
+    starts = np.searchsorted(bins, np.arange(nbins))
+    samples = np.diff(np.append(starts, len(bins)))
+    counts = np.zeros((nbins, len(flag_bits), flags.shape[-1]), dtype=np.int64)
+    occupied = samples > 0
+    for b, bit in enumerate(flag_bits):
+        counts[occupied, b] = np.add.reduceat((flags & bit) != 0, starts[occupied], axis=0, dtype=np.int64)
+
+    if per_window > 1:
+        # sliding windows: differences of running totals over bins
+        nwindows = max(nbins - per_window + 1, 1)
+        cumulative = np.concatenate((np.zeros((1,) + counts.shape[1:], dtype=np.int64), np.cumsum(counts, axis=0)))
+        cumulative_samples = np.append(0, np.cumsum(samples))
+        stop = np.minimum(np.arange(nwindows) + per_window, nbins)
+        counts = cumulative[stop] - cumulative[:nwindows]
+        samples = cumulative_samples[stop] - cumulative_samples[:nwindows]
+
+    offsets = np.arange(len(counts)) * step
+    start = origin + (offsets * 1e6).astype('timedelta64[us]') if datetimes else origin + offsets
+    return FlagStats(start, window, counts, samples)
+
+def decimate(x, y, buckets: int):
+    """
+    Reduce a time series to at most 3 points per bucket for plotting.
+
+    Parameters
+    ----------
+    `x`: 1-D array (or `list`) of N sample positions, e.g. times.
+        Numbers, `np.datetime64` or `datetime.datetime` all work.
+    `y`: array of N values, or (N, C) values for C channels.
+    `buckets`: how many buckets to split the range of `x` into,
+        usually the width of the plot in pixels.
+
+    Within each bucket, each channel is reduced to its minimum and
+    maximum, so isolated spikes stay visible. If a bucket held any
+    NaN for a channel, a NaN follows its min/max, so gaps in the
+    data still break the plotted line. Series that are already short
+    enough are returned unchanged.
+
+    Returns a tuple `(x, y)` in the same form as the inputs.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x.dtype == object:
+        x = x.astype('datetime64[us]')
+    if len(x) <= 3*buckets:
+        return x, y
+
+    squeeze = y.ndim == 1
+    if squeeze:
+        y = y[:, None]
+    position = x.astype('datetime64[us]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    low, high = position.min(), position.max()
+    if high == low:
+        bucket = np.zeros(len(position), dtype=np.int64)
+    else:
+        # the last sample lands exactly on `buckets`, so clamp it into the last bucket:
+        bucket = np.minimum((position - low) / (high - low) * buckets, buckets - 1).astype(np.int64)
+
+    # contiguous runs of samples in the same bucket:
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    stops = np.append(starts[1:], len(x)) - 1
+    with np.errstate(invalid='ignore'):
+        lows = np.fmin.reduceat(y, starts, axis=0)
+        highs = np.fmax.reduceat(y, starts, axis=0)
+    gaps = np.logical_or.reduceat(np.isnan(y), starts, axis=0)
+
+    x_out = np.stack((x[starts], x[stops], x[stops]), axis=1).reshape(-1)
+    y_out = np.stack((lows, highs, np.where(gaps, np.nan, highs)), axis=1).reshape(-1, y.shape[1])
+    if squeeze:
+        y_out = y_out[:, 0]
+    return x_out, y_out
+
+def plot_buckets(fig, min_width: float = 0):
+    """Number of decimation buckets for a plot spanning the width of `fig` (or `min_width` inches, if wider)."""
+    return int(max(fig.get_figwidth(), min_width) * fig.dpi)
+
+def follow(file: str, window: float = 600, interval: float = 1.0):
+    """
+    Live plot of the last `window` seconds of a growing RTD log.
+
+    Parameters
+    ----------
+    `file`: a path to a `housekeeping_rtd.log` that is being written.
+    `window`: seconds of history to display.
+    `interval`: seconds between refreshes.
+
+    The log is parsed once, then each refresh only decodes newly
+    appended frames with `Parser.update()` and redraws the window.
+    """
+    parser = Parser(file)
+    plt.ion()
+    fig, axs = plt.subplots(2, 1, figsize=(12,6), sharex=True)
+    lines = {}
+    for chip, ax in zip([1,2], axs):
+        lines[chip] = ax.plot(np.zeros((0,9)), np.zeros((0,9)))
+        ax.set_ylabel("Temperature (ºC)")
+        ax.set_ylim(ranges[chip])
+        ax.set_title("chip " + str(chip), fontsize='medium')
+        ax.grid(which='major', axis='y')
+        ax.legend(labels[chip].values(), loc='lower left', fontsize='x-small')
+    axs[-1].set_xlabel("Unixtime [s]")
+
+    while plt.fignum_exists(fig.number):
+        parser.update()
+        for chip, ax in zip([1,2], axs):
+            samples = parser.samples[chip]
+            if len(samples) == 0:
+                continue
+            first = np.searchsorted(samples.unixtime, samples.unixtime[-1] - window)
+            times = samples.unixtime[first:]
+            temps = np.where(samples.flag[first:] == 1, samples.temp[first:], np.nan)
+            for channel, line in enumerate(lines[chip]):
+                line.set_data(times, temps[:, channel])
+            ax.set_xlim(times[-1] - window, times[-1] + 1)
+        plt.pause(interval)
+
+def annotate_log(notes: str, fig, ax, chip, day: datetime.datetime, outdir: str|None):
+    """
+    Mark each line of the `notes` file ("HH:MM:SS - text") on `ax`
+    in `fig` as a vertical line with its text, widen the figure to
+    100 inches, and save it as `rtd_cs<chip>_notes.pdf` in `outdir`
+    (if given). Note times are taken to be on the date of `day`.
+    """
+    max_note_length = 40
+    
+    mdy_start = datetime.datetime.combine(day.date(), datetime.time.min)
+    with open(notes, 'r') as fnote:
+        ylim = ax.get_ylim()
+        new_ylim = (ylim[1] - (ylim[1] - ylim[0])*4/3, ylim[1])
+        offset = (new_ylim[1] - new_ylim[0])*0.01
+
+        for line in fnote.readlines():
+            if line.isspace():
+                continue
+            time = line.split("-",1)[0].lstrip().rstrip()
+            text = line.split("-",1)[1].lstrip().rstrip()
+            if len(text) > max_note_length:
+                text = text[:max_note_length - 3] + '...'
+            
+            timed = datetime.datetime.strptime(time, "%H:%M:%S")
+            time_mv = datetime.datetime.combine(mdy_start, timed.time())
+
+            ax.set_ylim(new_ylim)
+            ax.axvline(time_mv, color='black', linewidth='0.1')
+            ax.text(time_mv, new_ylim[0] + offset, text, fontsize='xx-small', rotation=90, ha='left', va='baseline')
+        
+        fig.set_size_inches(100, 6)
+        if outdir is not None:
+            fig.savefig(os.path.join(outdir, 'rtd_cs'+str(chip)+'_notes.pdf'), transparent=True)
+
+def render_chip(chip, total_time, total_temp, stats: FlagStats, title_prefix: str, outdir: str|None = None, notes: str|None = None, day: datetime.datetime|None = None):
+    """
+    Plot the aggregate temperature history and total error rate for
+    one RTD `chip`, and a histogram of flag bits for each channel.
+
+    Parameters
+    ----------
+    `chip`: the RTD chip number (`1` or `2`).
+    `total_time`: (N,) `np.datetime64` sample times.
+    `total_temp`: (N, 9) temperatures, nan where flagged or between logs.
+    `stats`: the chip's `FlagStats`, for the error rate and flag histogram.
+    `title_prefix`: start of the figure title, the chip number is appended.
+    `outdir`: if given, save `rtd_cs<chip>.pdf` and `rtd_cs<chip>_flaghist.pdf` here.
+    `notes`: if given, a notes file to annotate a copy of the history with (see `annotate_log`).
+    `day`: the date the `notes` times are on.
+
+    Returns the two figures, `(fig, hfig)`.
+    """
+    fig, (eax, ax) = plt.subplots(2,1,figsize=(12,6), sharex=1, height_ratios=[1,3])
+    ax_label_font_size = 'medium'
+    # annotate_log widens the figure to 100 inches
+    buckets = plot_buckets(fig, 100 if notes is not None else 0)
+    ax.plot(*decimate(total_time, total_temp, buckets))
+    ax.set(
+        xlabel="Time",
+        ylabel="Temperature (ºC)",
+        ylim=ranges[chip]
+    )
+    ax.set_xlabel(r"$\text{Time}$", fontsize=ax_label_font_size)
+    ax.set_ylabel("Temperature (ºC)", fontsize=ax_label_font_size)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(which='major', axis='y')
+    startx = int(round(len(total_time)*7/16))
+    # startx=0
+    ax.set_xlim(total_time[startx], total_time[len(total_time) - 1])
+    ax.xaxis.set_major_formatter(mpl.dates.DateFormatter('%H:%M:%S'))
+    ax.legend(labels[chip].values(), loc='lower left', fontsize='x-small')
+
+    # error rate plots
+    eax.plot(*decimate(stats.center, stats.error_rate, buckets), color='black')
+    eax.set_ylabel(r'$\text{Total error rate} \ [s^{-1}]$', fontsize=ax_label_font_size)
+    eax.set_title(title_prefix + str(chip), fontsize='medium')
+    eax.grid(visible=True, which='major', axis='y')
+    fig.align_ylabels([eax,ax])
+
+    fig.tight_layout()
+
+    # flags over the plotted time range
+    agg_flag = stats.total(start=total_time[startx])
+    hfig, haxs = plt.subplots(9,1,figsize=(5,8))
+    for p,hax in enumerate(haxs.reshape(-1)):
+        
+        bin_values = [flag_values[k] for k in flag_values.keys()]
+        if p < len(haxs) - 1:
+            hax.axes.get_xaxis().set_visible(False)
+        
+        # hax.bar(bin_values, total_flag[:,p])
+        hax.bar(bin_values, agg_flag[:,p], color='black')
+        hax.set_ylabel('Counts')
+        hax.set_title(labels[chip][p], size='small')
+        # plt.setp( hax. yaxis.get_label(), rotation=0, ha='right' )
+        plt.setp(hax.xaxis.get_ticklabels(), size='x-small')
+        plt.setp(hax.yaxis.get_ticklabels(), size='x-small')
+        plt.setp(hax.xaxis.get_label(), size='small')
+        plt.setp(hax.yaxis.get_label(), size='small')
+    haxs[-1].tick_params(axis='x', labelrotation=90)
+    # plt.grid(which='major', axis='y')
+    hfig.tight_layout()
+
+    if outdir is not None:
+        fig.savefig(os.path.join(outdir, 'rtd_cs'+str(chip)+'.pdf'), transparent=True)
+        hfig.savefig(os.path.join(outdir, 'rtd_cs'+str(chip)+'_flaghist.pdf'), transparent=True)
+    
+    if notes is not None:
+        annotate_log(notes, fig, ax, chip, day, outdir)
+
+    return fig, hfig
+
+def render_chip_headless(args: tuple):
+    """Run `render_chip(*args)` with a non-interactive backend and close the figures. For worker processes."""
+    plt.switch_backend('agg')
+    render_chip(*args)
+    plt.close('all')
+
+def render_all(jobs: list[tuple], workers: int|None = None):
+    """
+    Render and save every `render_chip` argument tuple in `jobs`
+    headless, on a pool of `workers` processes (by default, one per
+    CPU).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 2 or len(jobs) < 2:
+        for job in jobs:
+            render_chip_headless(job)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(render_chip_headless, jobs))
+
+def batch(root_folder: str, notes=None, workers: int|None = None, cache: ParseCache|None = None):
+    """
+    Headless plots for every session under `root_folder`. A session
+    is a folder holding a `housekeeping_rtd.log`, and its PDFs are
+    saved into that folder. All figures from all sessions are
+    rendered together on a pool of `workers` processes.
+    """
+    sessions = sorted(root for root, dirs, files in os.walk(root_folder) if "housekeeping_rtd.log" in files)
+    jobs = []
+    for session in sessions:
+        plotter = Plotter(session, notes, workers=1, cache=cache, headless=True, outdir=session, render=False)
+        jobs.extend(plotter.jobs)
+    print("rendering", len(jobs), "chip plots from", len(sessions), "sessions ...")
+    render_all(jobs, workers)
+
 class Plotter:
-    def __init__(self, root_folder: str, notes=None):
+    def __init__(self, root_folder: str, notes=None, workers: int|None = None, cache: ParseCache|None = None, headless=False, outdir: str|None = None, render=True, flag_window: float = 10.0):
         """
         Recursively search for all files named `housekeeping_rtd.log` under the provided `root_folder`, and plot temperature histories and difference histograms for each.
+
+        Files are parsed in parallel on a pool of `workers` processes (by default, one per CPU). Each worker sends back its `Parser`, which only holds compact `RTDSamples` arrays. Use `workers=1` to parse in this process instead. If a `ParseCache` is given as `cache`, logs that were decoded before are loaded from it.
+
+        PDFs are saved in `outdir`, or by default in the folder that contains `root_folder`. With `headless`, nothing is shown: each chip's figures are rendered and saved by `render_all` in worker processes instead. To collect those jobs without running them (as `batch` does), also pass `render=False` and use `self.jobs`.
+
+        Flag bits are counted over all logs in tumbling `flag_window`-second windows, kept per chip in `self.stats` (see `flag_stats`).
         """
         self.root_folder = root_folder
+        self.outdir = outdir if outdir is not None else os.path.dirname(os.path.abspath(self.root_folder))
+        self.headless = headless
+        self.flag_window = flag_window
+        self.stats = {}
+        if headless:
+            plt.switch_backend('agg')
         files = self.find("housekeeping_rtd.log")
         # print("found files:")
         # [print(file) for file in files]
         if len(files) == 0:
             print("Found no housekeeping_rtd.log files under the prefix. Exiting.")
 
-        self.data = [Parser(file) for file in files]
+        self.data = self.parse_all(files, workers, cache)
         self.data = sorted(self.data, key=lambda s: s.start)
         self.notes = notes
         self.fig = []
         self.ax = []
+        self.jobs = []
         self.plot()
         # if notes is not None:
         #     self.annotate_log(notes)
-        plt.show()
+        if headless:
+            if render:
+                render_all(self.jobs, workers)
+        else:
+            plt.show()
+
+    def parse_all(self, files: list[str], workers: int|None = None, cache: ParseCache|None = None):
+        """
+        Return a `Parser` for each of `files`, using a pool of
+        `workers` processes when there is more than one file.
+        """
+        parse = functools.partial(Parser, cache=cache)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 2 or len(files) < 2:
+            return [parse(file) for file in files]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(parse, files))
 
     def find(self, name: str):
         result = []
@@ -189,107 +1096,55 @@ class Plotter:
         return result
     
     def annotate_log(self, notes: str, fig, ax, chip):
-        max_note_length = 40
-        
-        mdy = self.data[0].start
-        mdy_start = datetime.datetime.combine(mdy.date(), datetime.time.min)
-        with open(notes, 'r') as fnote:
-            ylim = ax.get_ylim()
-            new_ylim = (ylim[1] - (ylim[1] - ylim[0])*4/3, ylim[1])
-            offset = (new_ylim[1] - new_ylim[0])*0.01
-
-            for line in fnote.readlines():
-                if line.isspace():
-                    continue
-                time = line.split("-",1)[0].lstrip().rstrip()
-                text = line.split("-",1)[1].lstrip().rstrip()
-                if len(text) > max_note_length:
-                    text = text[:max_note_length - 3] + '...'
-                
-                timed = datetime.datetime.strptime(time, "%H:%M:%S")
-                time_mv = datetime.datetime.combine(mdy_start, timed.time())
-
-                ax.set_ylim(new_ylim)
-                ax.axvline(time_mv, color='black', linewidth='0.1')
-                ax.text(time_mv, new_ylim[0] + offset, text, fontsize='xx-small', rotation=90, ha='left', va='baseline')
-            
-            fig.set_size_inches(100, 6)
-            fig.savefig(os.path.join(os.path.dirname(os.path.abspath(self.root_folder)), 'rtd_cs'+str(chip)+'_notes.pdf'), transparent=True)
-
+        annotate_log(notes, fig, ax, chip, self.data[0].start, self.outdir)
 
     def plot(self, aggregate_plot=True, save_plot=True, diff_plot=False):
-        total_time = [[],[]]
-        total_flag = [np.zeros([0,8,9], dtype=np.uint32), 
-                      np.zeros([0,8,9], dtype=np.uint32)]
-        total_temp = [np.empty([0,9], dtype=np.float32),
-                       np.empty([0,9], dtype=np.float32)] # time by channel by chip
+        total_time = [None, None]
+        total_temp = [None, None] # time by channel by chip
         for chip in [1,2]:
             chip_index = chip - 1
-            for pack in self.data:
-                rtd_src = pack.rtd_data[chip]
+            packs = [pack for pack in self.data if len(pack.samples[chip]) > 0]
 
-                unixtimes = np.array([int.from_bytes(field['unixtime'],'big') for field in rtd_src], dtype=np.uint32)
-                if unixtimes.size == 0:
-                    continue
+            # preallocate the whole session, with a spare row after each pack
+            # of data that stays nan (for plot breaks where there is a data jump)
+            length = sum(len(pack.samples[chip]) + 1 for pack in packs)
+            total_time[chip_index] = np.empty(length, dtype='datetime64[us]')
+            total_temp[chip_index] = np.full([length, 9], np.nan, dtype=np.float32)
 
-                times = unixtimes - np.min(unixtimes)
+            row = 0
+            pack_times = []
+            pack_flags = []
+            for pack in packs:
+                samples = pack.samples[chip]
+                n = len(samples)
+
+                unixtimes = samples.unixtime
                 if pack.start is not None:
-                    times = [pack.start + datetime.timedelta(seconds=time.item()) for time in times]
+                    times = np.datetime64(pack.start, 'us') + (unixtimes - np.min(unixtimes)).astype('timedelta64[s]')
                     title_text = pack.start.strftime("%B %d %Y %H:%M:%S")
                 else:
+                    times = unixtimes.astype('datetime64[s]').astype('datetime64[us]')
                     title_text = pack.name
 
-                total_time[chip_index].extend(times)
-
-                temps = np.zeros([len(rtd_src), 9], dtype=np.float32)
-                flags = np.zeros([len(rtd_src), 9], dtype=np.uint8)
-                diffs = np.zeros([len(rtd_src), 9], dtype=np.float32)
-
-                # total_flag[chip_index].resize([len(rtd_src), 8, 9])
-
-                ch_slice_flag = np.zeros([1,8,9], dtype=np.uint32)
-                for i,record in enumerate(rtd_src):
-                    for j,sensor in enumerate(record['data'].keys()):
-                        # record sensor value and error flag for each sensor at each time.
-                        temps[i][j] = record['data'][sensor]['temp']
-                        flags[i][j] = record['data'][sensor]['flag']
-
-                        if i > 0:
-                            # record change in each sensor value from one index to the next
-                            diffs[i - 1][j] = temps[i][j] - temps[i - 1][j]
-
-                        if flags[i][j] != 1:
-                            temps[i][j] = np.nan
-
-                        for k, key in enumerate(flag_values.keys()):
-                            ch_slice_flag[0,k,j] = ((key & flags[i][j]) != 0)
-                            # total_flag[chip_index][k, j] += ((key & flags[i][j]) != 0)
-                        
-                    # total_flag[chip_index][i] = ch_slice_flag
-                    # total_flag[chip_index].extend(ch_slice_flag)
-                    total_flag[chip_index] = np.concatenate((total_flag[chip_index], ch_slice_flag), axis=0)
-                        # if (flags[i][j] & 1) != 1:
-                        #     temps[i][j] = np.nan
-
-                # pad with nans before going on to next pack of data (for plot breaks where there is a data jump)
-                total_temp[chip_index] = np.append(total_temp[chip_index], temps, axis=0)
-                total_time[chip_index].append(total_time[chip_index][-1])
-                temp_nans = np.empty([1,9])
-                temp_nans.fill(np.nan)
-                total_temp[chip_index] = np.append(total_temp[chip_index], temp_nans, axis=0)
-                flag_nans = np.zeros([1,8,9])
-                # flag_nans.fill(np.nan)
-                total_flag[chip_index] = np.append(total_flag[chip_index], flag_nans, axis=0)
-
-                print("flag", np.shape(total_flag[chip_index]))
-                print("time", np.shape(total_time[chip_index]))
-                print("temp", np.shape(total_temp[chip_index]))
+                flags = samples.flag
+                # a flag value != 1 is cause to suspect the measurement
+                temps = np.where(flags == 1, samples.temp, np.nan).astype(np.float32)
+                # record change in each sensor value from one index to the next
+                diffs = np.zeros([n, 9], dtype=np.float32)
+                diffs[:-1] = samples.temp[1:] - temps[:-1]
+
+                total_time[chip_index][row:row + n] = times
+                total_time[chip_index][row + n] = times[-1]
+                total_temp[chip_index][row:row + n] = temps
+                pack_times.append(times)
+                pack_flags.append(flags)
+                row += n + 1
 
                 # plt.rcParams['text.usetex'] = True
                 if not aggregate_plot:
                     fig, ax = plt.subplots(figsize=(12,6))
 
-                    ax.plot(times, temps)
+                    ax.plot(*decimate(times, temps, plot_buckets(fig)))
                     ax.set(
                         xlabel="Time",
                         ylabel="Temperature (ºC)",
@@ -311,81 +1166,41 @@ class Plotter:
                         plt.legend(labels[chip].values())
                     
                     if save_plot:
-                        plt.savefig(os.path.join(os.path.dirname(os.path.abspath(self.root_folder)), 'rtd_cs'+str(chip)+'.pdf'))
-        
+                        plt.savefig(os.path.join(self.outdir, 'rtd_cs'+str(chip)+'.pdf'))
+
+            self.stats[chip] = flag_stats(pack_times, pack_flags, self.flag_window)
+
         if aggregate_plot:
-            for chip in self.data[0].rtd_data:
-                fig, (eax, ax) = plt.subplots(2,1,figsize=(12,6), sharex=1, height_ratios=[1,3])
-                ax_label_font_size = 'medium'
-                ax.plot(total_time[chip-1], total_temp[chip-1])
-                ax.set(
-                    xlabel="Time",
-                    ylabel="Temperature (ºC)",
-                    ylim=ranges[chip]
-                )
-                # plt.title(title_text + ", chip " + str(chip), fontsize=10)
-                # title_prefix = self.data[chip - 1].start.strftime("%B %d %Y - chip ")
-                # plt.title(title_prefix + str(chip), fontsize=10)
-                plt.xlabel(r"$\text{Time}$", fontsize=ax_label_font_size)
-                plt.ylabel("Temperature (ºC)", fontsize=ax_label_font_size)
-                plt.xticks(rotation=45)
-                plt.grid(which='major', axis='y')
-                startx = int(round(len(total_time[chip-1])*7/16))
-                # startx=0
-                ax.set_xlim(total_time[chip-1][startx], total_time[chip-1][len(total_time[chip-1]) - 1])
-                ax.xaxis.set_major_formatter(mpl.dates.DateFormatter('%H:%M:%S'))
-                plt.legend(labels[chip].values(), loc='lower left', fontsize='x-small')
-
-                # error rate plots
-                rect_flag = np.nan_to_num(total_flag[chip-1])
-                time_d = [td.total_seconds() for td in np.diff(total_time[chip-1])]
-                error_rate = np.diff(np.cumsum(np.sum(rect_flag[:,1::,:], axis=(1,2)), axis=0)) / time_d
-
-                eax.plot(total_time[chip-1][1::], error_rate, color='black')
-                eax.set_ylabel(r'$\text{Total error rate} \ [s^{-1}]$', fontsize=ax_label_font_size)
-                title_prefix = self.data[chip - 1].start.strftime("%B %d %Y - chip ")
-                eax.set_title(title_prefix + str(chip), fontsize='medium')
-                eax.grid(visible=True, which='major', axis='y')
-                fig.align_ylabels([eax,ax])
-
-                plt.tight_layout()
-
-                hfig, haxs = plt.subplots(9,1,figsize=(5,8))
-                for p,hax in enumerate(haxs.reshape(-1)):
-                    
-                    bin_values = [flag_values[k] for k in flag_values.keys()]
-                    if p < len(haxs) - 1:
-                        hax.axes.get_xaxis().set_visible(False)
-                    
-                    agg_flag = np.sum(total_flag[chip-1][startx::,:,p], axis=0)
-                    # hax.bar(bin_values, total_flag[chip-1][:,p])
-                    hax.bar(bin_values, agg_flag, color='black')
-                    hax.set_ylabel('Counts')
-                    hax.set_title(labels[chip][p], size='small')
-                    # plt.setp( hax. yaxis.get_label(), rotation=0, ha='right' )
-                    plt.setp(hax.xaxis.get_ticklabels(), size='x-small')
-                    plt.setp(hax.yaxis.get_ticklabels(), size='x-small')
-                    plt.setp(hax.xaxis.get_label(), size='small')
-                    plt.setp(hax.yaxis.get_label(), size='small')
-                plt.xticks(rotation=90)
-                # plt.grid(which='major', axis='y')
-                hfig.tight_layout()
-
-                
-
-                if save_plot:
-                    fig.savefig(os.path.join(os.path.dirname(os.path.abspath(self.root_folder)), 'rtd_cs'+str(chip)+'.pdf'), transparent=True)
-                    hfig.savefig(os.path.join(os.path.dirname(os.path.abspath(self.root_folder)), 'rtd_cs'+str(chip)+'_flaghist.pdf'), transparent=True)
-                
-                if self.notes is not None:
-                    self.annotate_log(self.notes, fig, ax, chip)
+            first = self.data[0]
+            title_prefix = first.start.strftime("%B %d %Y - chip ") if first.start is not None else first.name + " - chip "
+            for chip in first.samples:
+                job = (chip, total_time[chip-1], total_temp[chip-1], self.stats[chip], title_prefix,
+                       self.outdir if save_plot else None, self.notes, first.start)
+                if self.headless:
+                    self.jobs.append(job)
+                else:
+                    self.fig.extend(render_chip(*job))
 
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        print("Digging under prefix", sys.argv[1])
-        if len(sys.argv) > 2:
-            p = Plotter(sys.argv[1], sys.argv[2])
-        else:
-            p = Plotter(sys.argv[1])
+    import argparse
+    argparser = argparse.ArgumentParser("rtd.py")
+    argparser.add_argument("path", help="folder to search for housekeeping_rtd.log files, or one log file to follow live")
+    argparser.add_argument("notes", nargs="?", default=None, help="notes file to annotate the plots with")
+    argparser.add_argument("--headless", action="store_true", help="save PDFs without opening any windows")
+    argparser.add_argument("--batch", action="store_true", help="plot every session folder under `path` separately (headless), saving PDFs into each session folder")
+    argparser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    argparser.add_argument("--no-cache", action="store_true", help="don't use or update the parsed-data cache")
+    args = argparser.parse_args()
+    cache = None if args.no_cache else ParseCache()
+
+    if os.path.isfile(args.path):
+        print("Following", args.path)
+        follow(args.path)
+    elif args.batch:
+        print("Batch plotting sessions under", args.path)
+        batch(args.path, args.notes, workers=args.workers, cache=cache)
+    else:
+        print("Digging under prefix", args.path)
+        p = Plotter(args.path, args.notes, workers=args.workers, cache=cache, headless=args.headless)
@@ -1,8 +1,15 @@
 import socket, os, sys, struct, time
+import argparse
+import asyncio
+from queue import SimpleQueue
+import threading
+import warnings
 from datetime import datetime
 
 import numpy as np
 
+from rtd import labels
+
 default_local_ip = "192.168.1.180"
 default_local_port = 9999
 
@@ -17,9 +24,210 @@ nperchip = 9
 nchip = 2
 nsensor = nperchip * nchip
 
+# packet system and type bytes, data[0] and data[5]:
+housekeeping_system = 0x02
+rtd_type = 0x12
+# the real type byte of power packets isn't known yet. replay.py tags
+# them with this, but listen only decodes power packets when their
+# type is given with --pow-type; otherwise they are just counted.
+pow_type = 0x11
+
+# RTD channel data starts this many bytes into a packet:
+rtd_offset = 14
+rtd_packet_size = rtd_offset + 4 * nperchip
+# the logged RTD frame (chip, reserved, unixtime, channels) starts here:
+rtd_frame_offset = rtd_offset - 6
+# a power frame starts this many bytes into a packet, as replay.py
+# builds them (also unconfirmed; see --pow-offset):
+pow_offset = 8
+pow_frame_size = 38
+
+default_rcvbuf = 1 << 22
+default_queue = 256
+default_history = 10
+default_rate = 10
+# most datagrams to read from the socket in one wakeup:
+max_batch = 1024
+# kernel receive timestamps (Linux); Python's socket module doesn't name these:
+so_timestampns = getattr(socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else None)
+timespec = struct.Struct("@ll")
+
+# command line argument setup
+parser = argparse.ArgumentParser("rtddebug.py")
+parser.add_argument("--local-ip", help="IP address of this computer (default " + default_local_ip + ")", type=str, default=default_local_ip)
+parser.add_argument("--local-port", help="Port number of this computer (default " + str(default_local_port) + ")", type=int, default=default_local_port)
+parser.add_argument("--benchmark", help="Time the RTD decoder on N synthetic packets and exit", type=int, default=0, metavar="N")
+parser.add_argument("--rcvbuf", help="Socket receive buffer size in bytes (default " + str(default_rcvbuf) + ")", type=int, default=default_rcvbuf)
+parser.add_argument("--history", help="Minutes of samples to keep per chip (default " + str(default_history) + ")", type=float, default=default_history)
+parser.add_argument("--rate", help="Most packets per second expected from each chip, to size the history (default " + str(default_rate) + ")", type=float, default=default_rate)
+parser.add_argument("--record", help="Save every received packet to this file, with an index beside it (default " + default_filename + ")", type=str, nargs="?", const=default_filename, default=None, metavar="PATH")
+parser.add_argument("--index-every", help="Index every Nth recorded packet (default 64)", type=int, default=64, metavar="N")
+parser.add_argument("--display", help="'strip' prints a line per packet, 'table' redraws the latest values in place (default strip)", choices=["strip", "table"], default="strip")
+parser.add_argument("--fps", help="Table redraws per second (default 10)", type=float, default=10)
+parser.add_argument("--stats", help="Print packet loss and timing statistics every this many seconds (default: only on exit)", type=float, default=0, metavar="SECONDS")
+parser.add_argument("--sequence", help="Also check the packet counter in header bytes 1-4 (as replay.py sends it) for losses", action="store_true")
+parser.add_argument("--pow-type", help="Type byte (data[5]) of power packets to decode, e.g. 0x11 as replay.py sends (default: don't decode, only count)", type=lambda text: int(text, 0), default=None)
+parser.add_argument("--pow-offset", help="Where the power frame starts in a power packet (default " + str(pow_offset) + ")", type=int, default=pow_offset)
+parser.add_argument("--queue", help="Most decoded batches waiting for display before new ones are dropped (default " + str(default_queue) + ")", type=int, default=default_queue)
+
+
+class History:
+    """A ring buffer of one chip's most recent samples.
+
+    Holds up to `capacity` samples in preallocated arrays: the receive
+    time (`time.time()` seconds) of each, and each channel's flag and
+    temperature. Appending overwrites the oldest sample once full.
+    Samples must be appended in time order for the window queries.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.errors = np.zeros((capacity, nperchip), dtype=np.uint8)
+        self.values = np.zeros((capacity, nperchip), dtype=np.float32)
+        # next index to write, and how many samples are held:
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t: float, errors, values):
+        """Add one sample's flags and temperatures, received at `t`."""
+        self.times[self.head] = t
+        self.errors[self.head] = errors
+        self.values[self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def extend(self, t, errors, values):
+        """Add (N, 9) `errors` and `values`, received at `t` (one time, or one per sample)."""
+        n = len(values)
+        if n > self.capacity:
+            t = np.broadcast_to(t, (n,))[-self.capacity:]
+            errors, values, n = errors[-self.capacity:], values[-self.capacity:], self.capacity
+        first = min(n, self.capacity - self.head)
+        for dest, src in ((self.times, np.broadcast_to(t, (n,))), (self.errors, errors), (self.values, values)):
+            dest[self.head:self.head + first] = src[:first]
+            dest[:n - first] = src[first:]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def spans(self, since: float = -np.inf):
+        """Slices into the arrays, oldest first, of the samples received at or after `since`."""
+        if self.count < self.capacity:
+            segments = [slice(0, self.head)]
+        else:
+            segments = [slice(self.head, self.capacity), slice(0, self.head)]
+        result = []
+        for segment in segments:
+            first = segment.start + np.searchsorted(self.times[segment], since)
+            if first < segment.stop:
+                result.append(slice(first, segment.stop))
+        return result
+
+    def window(self, seconds: float, channel: int|None = None, now: float|None = None):
+        """The samples from the last `seconds` before `now` (default: the latest sample).
 
-def parse_rtd(id: int, data: bytes):
-    blob = data[14:]
+        Returns `(times, errors, values)` copies, oldest first. With a
+        `channel`, `errors` and `values` are just that channel's (N,).
+        """
+        if now is None:
+            now = self.times[self.head - 1] if self.count > 0 else 0.0
+        spans = self.spans(now - seconds)
+        columns = slice(None) if channel is None else channel
+        times = np.concatenate([self.times[s] for s in spans]) if spans else self.times[:0]
+        errors = np.concatenate([self.errors[s, columns] for s in spans]) if spans else self.errors[:0, columns]
+        values = np.concatenate([self.values[s, columns] for s in spans]) if spans else self.values[:0, columns]
+        return times, errors, values
+
+    def stats(self, seconds: float, channel: int|None = None, now: float|None = None):
+        """`(min, max, mean)` of the valid (flag 1) temperatures in `window(seconds, channel, now)`, nan if there are none."""
+        _, errors, values = self.window(seconds, channel, now)
+        valid = np.where(errors == 1, values, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            return np.nanmin(valid, axis=0), np.nanmax(valid, axis=0), np.nanmean(valid, axis=0)
+
+    def latest_valid(self, channel: int):
+        """`(time, value)` of the newest valid (flag 1) sample on `channel`, or `None`."""
+        for span in reversed(self.spans()):
+            valid = np.flatnonzero(self.errors[span, channel] == 1)
+            if len(valid) > 0:
+                k = span.start + valid[-1]
+                return float(self.times[k]), float(self.values[k, channel])
+        return None
+
+
+class DecodeBuffers:
+    """Preallocated arrays for decoding up to `capacity` RTD packets at once.
+
+    Each packet's channel words are copied into the `blob` staging
+    area. `flags` views the flag byte of every word, and `words` views
+    the blob one byte later as native `np.int32`, so each word holds a
+    24-bit temperature followed by the next flag byte. `raw`, `chips`,
+    `errors` and `values` receive the results. `views(n)` gives the
+    first `n` rows of each, cached per batch size.
+    """
+    __slots__ = ("blob", "flags", "words", "raw", "chips", "errors", "values", "cache")
+
+    def __init__(self, capacity: int = max_batch):
+        size = 4 * nperchip
+        # one spare byte at the end, for the last word of `words`:
+        self.blob = bytearray(size * capacity + 1)
+        self.flags = np.frombuffer(self.blob, dtype=np.uint8, count=size * capacity).reshape(capacity, nperchip, 4)[:, :, 0]
+        self.words = np.frombuffer(self.blob, dtype=np.int32, count=nperchip * capacity, offset=1).reshape(capacity, nperchip)
+        self.raw = np.zeros((capacity, nperchip), dtype=np.int32)
+        self.chips = np.zeros(capacity, dtype=np.uint8)
+        self.errors = np.zeros((capacity, nperchip), dtype=np.uint8)
+        self.values = np.zeros((capacity, nperchip), dtype=np.float32)
+        self.cache = {}
+
+    def views(self, n: int):
+        """`(flags, words, raw, chips, errors, values)`, each cut to `n` rows."""
+        views = self.cache.get(n)
+        if views is None:
+            views = self.cache[n] = (self.flags[:n], self.words[:n], self.raw[:n], self.chips[:n], self.errors[:n], self.values[:n])
+        return views
+
+
+def parse_rtd_batch(packets: list[bytes], out: DecodeBuffers|None = None):
+    """Decode a list of RTD packets together.
+
+    Every step writes into `out`, a `DecodeBuffers` with room for all
+    of `packets` (by default, a new one), so decoding into a reused
+    `out` allocates no arrays. The staging in `DecodeBuffers` means no
+    numpy call has to cast or byteswap through a buffer, so even a
+    batch of one packet is cheap. The live receiver keeps one `out`
+    per chip.
+
+    Returns `(chips, errors, values)`: the (N,) chip of each packet,
+    and the (N, 9) flags and temperatures (ºC) of its channels. These
+    are views of `out`, overwritten by the next batch decoded into it,
+    so copy them to keep them.
+    """
+    n = len(packets)
+    if out is None:
+        out = DecodeBuffers(n)
+    flags, words, raw, chips, errors, values = out.views(n)
+    blob = out.blob
+    size = 4 * nperchip
+    for k, data in enumerate(packets):
+        blob[size * k:size * (k + 1)] = data[rtd_offset:rtd_packet_size]
+        chips[k] = data[8]
+    np.copyto(errors, flags)
+    # big-endian to native in place, then shift out the trailing flag
+    # byte arithmetically, which sign-extends the 24-bit temperature:
+    words.byteswap(inplace=True)
+    np.right_shift(words, 8, out=raw)
+    np.copyto(values, raw, casting="same_kind")
+    values *= 1 / 1024.0  # move decimal 10 places left
+    return chips, errors, values
+
+
+def parse_rtd_loop(id: int, data: bytes):
+    """The original per-channel `int.from_bytes` decoder, kept as the baseline for `benchmark`."""
+    blob = data[rtd_offset:]
     channels = np.zeros(nperchip, dtype=np.uint8)
     errors = np.zeros(nperchip, dtype=np.uint8)
     values = np.zeros(nperchip, dtype=np.float32)
@@ -39,6 +247,44 @@ def parse_rtd(id: int, data: bytes):
     return channels, errors, values
 
 
+def benchmark(npackets: int, sizes=(1, 8, 64, max_batch)):
+    """Print packets per second for `parse_rtd_loop`, and for `parse_rtd_batch` into reused buffers at each batch size in `sizes`, on synthetic RTD packets.
+
+    At housekeeping rates the receiver usually wakes up for a single
+    packet, so the batch size 1 figure is the one the live path sees.
+    """
+    rng = np.random.default_rng(0)
+    packets = []
+    for k in range(min(npackets, max_batch)):
+        header = bytearray(rtd_offset)
+        header[0] = housekeeping_system
+        header[5] = rtd_type
+        header[8] = 1 + k % nchip
+        words = rng.integers(-(1 << 23), 1 << 23, nperchip, dtype=np.int32) & 0xFFFFFF
+        words |= rng.choice([0x00, 0x01, 0x04, 0xF0], nperchip).astype(np.int32) << 24
+        packets.append(bytes(header) + words.astype(">u4").tobytes())
+
+    start = time.perf_counter()
+    for k in range(npackets):
+        data = packets[k % len(packets)]
+        parse_rtd_loop(data[8], data)
+    elapsed = time.perf_counter() - start
+    print("{:32}{:12.0f} packets/s".format("per packet (parse_rtd_loop)", npackets / elapsed))
+
+    out = DecodeBuffers()
+    for size in sizes:
+        size = min(size, len(packets))
+        batches = [packets[k:k + size] for k in range(0, len(packets) - size + 1, size)]
+        count = 0
+        start = time.perf_counter()
+        while count < npackets:
+            for batch in batches:
+                parse_rtd_batch(batch, out)
+            count += size * len(batches)
+        elapsed = time.perf_counter() - start
+        print("{:32}{:12.0f} packets/s".format("batches of {} (parse_rtd_batch)".format(size), count / elapsed))
+
+
 def str_green(txt: str):
     return "\033[92m" + txt + "\033[0m"
 
@@ -65,34 +311,619 @@ def printstrip(id, channels, errors, values):
     print(strout, end=None)
 
 
-if __name__ == "__main__":
-    # join multicast group
-    local_recv_socket = socket.socket(
-        socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP
-    )
-    local_recv_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+# each recorded packet is preceded by its receive time and length:
+record_header = struct.Struct("<dH")
+# each index entry is a receive time and the byte offset of that packet's record:
+index_dtype = np.dtype([("time", "<f8"), ("offset", "<u8")])
 
-    local_recv_socket.bind((mcast_group, default_local_port))
-    mreq = struct.pack(
-        "4s4s", socket.inet_aton(mcast_group), socket.inet_aton(default_local_ip)
-    )
-    local_recv_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
-    print("joined!")
+class Recorder:
+    """Appends received packets to a binary log, with a sidecar index.
 
-    while True:
+    Each packet is stored as a `record_header` (receive time, length)
+    followed by its bytes. Every `index_every` packets, the time and
+    byte offset of that packet's record are added to `path + ".idx"`,
+    so `read_recording` can seek by time without scanning the log.
+
+    Writing happens on a background thread: `write` only queues a
+    batch, so a slow disk never holds up the receiver. Each batch is
+    joined into a single write through a `buffer_size`-byte buffer.
+    """
+
+    def __init__(self, path: str, index_every: int = 64, buffer_size: int = 1 << 20):
+        self.path = path
+        self.index_every = index_every
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.log = open(path, "ab", buffering=buffer_size)
+        self.index = open(path + ".idx", "ab", buffering=buffer_size)
+        self.offset = self.log.tell()
+        self.packets = 0
+        self.queue = SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+    def write(self, batch: list[bytes], times):
+        """Queue a batch of packets, received at (N,) `times`, for writing."""
+        self.queue.put((batch, times))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch, times = item
+            records = []
+            entries = []
+            for data, t in zip(batch, times.tolist()):
+                if self.packets % self.index_every == 0:
+                    entries.append((t, self.offset))
+                records.append(record_header.pack(t, len(data)))
+                records.append(data)
+                self.offset += record_header.size + len(data)
+                self.packets += 1
+            self.log.write(b"".join(records))
+            if entries:
+                self.index.write(np.array(entries, dtype=index_dtype).tobytes())
+
+    def close(self):
+        """Write everything still queued, then close the files."""
+        self.queue.put(None)
+        self.thread.join()
+        self.log.close()
+        self.index.close()
+
+
+def read_recording(path: str, start: float|None = None, stop: float|None = None):
+    """Yield `(time, data)` for each packet in a `Recorder` log received in [`start`, `stop`).
+
+    The sidecar index is used to seek straight to the last indexed
+    packet before `start`, so only up to `index_every` packets are
+    read and skipped before the first one returned.
+    """
+    offset = 0
+    if start is not None and os.path.exists(path + ".idx"):
+        index = np.fromfile(path + ".idx", dtype=index_dtype)
+        k = np.searchsorted(index["time"], start, side="left") - 1
+        if k >= 0:
+            offset = int(index["offset"][k])
+    with open(path, "rb") as log:
+        log.seek(offset)
+        while True:
+            header = log.read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            t, length = record_header.unpack(header)
+            data = log.read(length)
+            if len(data) < length:
+                return
+            if stop is not None and t >= stop:
+                return
+            if start is None or t >= start:
+                yield t, data
+
+
+class Dispatcher:
+    """Routes packets to decoders by their system and type bytes.
+
+    A decoder is registered for a `(system, type)` pair, read from
+    `data[0]` and `data[5]`, and is called as `decode(packets, times)`
+    with all packets of that type from one received batch, and their
+    (N,) receive times. Packets of
+    types with no decoder are only counted. For every type seen, the
+    number of packets, bytes and seconds spent decoding are kept in
+    `counters[(system, type)]`, updated once per batch.
+    """
+
+    def __init__(self):
+        self.decoders = {}
+        # packets too short to have a type byte are counted under (-1, -1):
+        self.names = {(-1, -1): "short"}
+        self.counters = {}
+
+    def register(self, system: int, type: int, name: str, decode=None):
+        self.decoders[(system, type)] = decode
+        self.names[(system, type)] = name
+
+    def name(self, key):
+        return self.names.get(key, "0x{:02x}/0x{:02x}".format(*key))
+
+    def dispatch(self, batch: list[bytes], times):
+        groups = {}
+        for k, data in enumerate(batch):
+            key = (data[0], data[5]) if len(data) > 5 else (-1, -1)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [k]
+            else:
+                group.append(k)
+
+        for key, rows in groups.items():
+            packets = [batch[k] for k in rows]
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = self.counters[key] = [0, 0, 0.0]
+            decode = self.decoders.get(key)
+            if decode is not None:
+                start = time.perf_counter()
+                decode(packets, times[rows])
+                counter[2] += time.perf_counter() - start
+            counter[0] += len(packets)
+            counter[1] += sum(len(data) for data in packets)
+
+    def report(self):
+        """One line of counters for each packet type seen."""
+        lines = []
+        for key, (packets, nbytes, seconds) in sorted(self.counters.items()):
+            lines.append("{:>10} {:10} packets {:12} bytes {:10.1f} µs/packet decoding".format(
+                self.name(key), packets, nbytes, 1e6 * seconds / packets if packets else 0.0
+            ))
+        return lines
+
+
+class PowerMonitor:
+    """A `Dispatcher` decoder for power packets, keeping the latest readings.
+
+    Each packet's `pow_frame_size`-byte frame at `offset` is parsed
+    with `parse` (the external `adcparser`), which returns a `(dict,
+    error)` pair. The newest good frame's `dict` of channel values is
+    kept in `latest`, for the table and the reports, and frames that
+    fail to parse are counted in `errors`. Power readings are not kept
+    in a `History`, since their channels are defined by `adcparser`.
+    """
+
+    def __init__(self, parse, offset: int = pow_offset):
+        self.parse = parse
+        self.offset = offset
+        self.frames = 0
+        self.errors = 0
+        self.latest = None
+
+    def __call__(self, packets: list[bytes], times):
+        for data in packets:
+            frame = data[self.offset:self.offset + pow_frame_size]
+            self.frames += 1
+            if len(frame) < pow_frame_size:
+                self.errors += 1
+                continue
+            values, error = self.parse(frame)
+            if error:
+                self.errors += 1
+            else:
+                self.latest = values
+
+    def summary(self):
+        text = "power: {} frames {} bad".format(self.frames, self.errors)
+        if self.latest is not None:
+            text += "  " + " ".join("{}={:g}".format(key, value) for key, value in self.latest.items())
+        return text
+
+
+def power_monitor(offset: int = pow_offset):
+    """A `PowerMonitor` using the external `adcparser`, or `None` if that can't be imported."""
+    try:
+        from external.telemetry_tools.parsers.Powerparser import adcparser
+    except ImportError:
+        return None
+    return PowerMonitor(adcparser, offset)
+
+
+class LinkStats:
+    """Loss, duplication, reordering and arrival timing of one chip's RTD packets.
+
+    Packets are checked by their embedded unixtime: one older than the
+    newest so far counts as out of order, a step of more than `max_gap`
+    seconds past the newest as a gap, and a repeat of the previous
+    whole frame as a duplicate. With `sequence`, the packet counter in header bytes 1-4
+    (as `replay.py` writes it) is also tracked, which counts exactly
+    how many packets were lost, including ones that arrive late.
+
+    Inter-arrival times go into a histogram with power-of-two
+    millisecond bins, `arrival_edges`. They need each packet's own
+    receive time, as `Receiver` gives with kernel timestamps. Without
+    those (`exact_times=False`), packets read in the same wakeup all
+    carry the wakeup's time, so only the interval from the previous
+    batch to the first packet of each batch is counted.
+    """
+
+    arrival_edges = 2.0 ** np.arange(-3, 15)
+
+    def __init__(self, max_gap: float = 2, sequence: bool = False, exact_times: bool = True):
+        self.max_gap = max_gap
+        self.sequence = sequence
+        self.exact_times = exact_times
+        self.packets = 0
+        self.gaps = 0
+        self.missing_seconds = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.arrivals = np.zeros(len(self.arrival_edges) + 1, dtype=np.int64)
+        self.last_frame = None
+        self.last_unixtime = None
+        self.last_arrival = None
+        # packet counter tracking:
+        self.highest = None
+        self.lost = 0
+        self.late = 0
+        self.outstanding = set()
+
+    def update(self, packets: list[bytes], times):
+        """Account for a batch of this chip's packets, received at (N,) `times`."""
+        n = len(packets)
+        frames = np.frombuffer(b"".join(data[rtd_frame_offset:rtd_packet_size] for data in packets), dtype=np.uint8).reshape(n, -1)
+        unixtimes = frames[:, 2:6].copy().view(">u4")[:, 0].astype(np.int64)
+        if self.last_frame is not None:
+            frames = np.concatenate((self.last_frame[None], frames))
+            unixtimes = np.concatenate(([self.last_unixtime], unixtimes))
+        # steps from the newest unixtime so far, so a late packet isn't followed by a false gap:
+        steps = unixtimes[1:] - np.maximum.accumulate(unixtimes)[:-1]
+        repeated = np.all(frames[1:] == frames[:-1], axis=1)
+        self.out_of_order += int(np.count_nonzero(steps < 0))
+        self.duplicates += int(np.count_nonzero(repeated))
+        gaps = steps > self.max_gap
+        self.gaps += int(np.count_nonzero(gaps))
+        self.missing_seconds += int(np.sum(steps[gaps] - 1))
+        self.last_frame = frames[-1].copy()
+        self.last_unixtime = unixtimes.max()
+
+        if self.last_arrival is not None:
+            times = np.concatenate(([self.last_arrival], times))
+        intervals = 1e3 * np.diff(times)
+        if not self.exact_times:
+            intervals = intervals[:1] if self.last_arrival is not None else intervals[:0]
+        self.arrivals += np.bincount(np.searchsorted(self.arrival_edges, intervals), minlength=len(self.arrivals))
+        self.last_arrival = times[-1]
+        self.packets += n
+
+        if self.sequence:
+            for data in packets:
+                self.count(int.from_bytes(data[1:5], "big"))
+
+    def count(self, number: int):
+        """Track one packet counter value."""
+        if self.highest is None or number > self.highest:
+            if self.highest is not None and number > self.highest + 1:
+                missed = range(self.highest + 1, number)
+                self.lost += len(missed)
+                # remember only recent holes, for late arrivals:
+                if len(missed) < 4096:
+                    self.outstanding.update(missed)
+                    if len(self.outstanding) > 65536:
+                        self.outstanding = set(sorted(self.outstanding)[-4096:])
+            self.highest = number
+        elif number in self.outstanding:
+            self.outstanding.discard(number)
+            self.lost -= 1
+            self.late += 1
+
+    def percentile(self, q: float):
+        """Approximate `q`th percentile inter-arrival time in ms, from the histogram bin edges."""
+        total = self.arrivals.sum()
+        if total == 0:
+            return np.nan
+        k = np.searchsorted(np.cumsum(self.arrivals), q / 100 * total)
+        return self.arrival_edges[min(k, len(self.arrival_edges) - 1)]
+
+    def summary(self):
+        text = "{:8} packets {:6} gaps ({} s missing) {:6} duplicates {:6} out of order  arrivals p50 <{:g} ms p99 <{:g} ms".format(
+            self.packets, self.gaps, self.missing_seconds, self.duplicates, self.out_of_order, self.percentile(50), self.percentile(99)
+        )
+        if self.sequence:
+            text += "  {} lost {} late".format(self.lost, self.late)
+        return text
+
+    def histogram(self):
+        """Lines of the inter-arrival histogram, one per non-empty bin."""
+        lines = []
+        lows = np.concatenate(([0], self.arrival_edges))
+        for low, high, count in zip(lows, np.append(self.arrival_edges, np.inf), self.arrivals):
+            if count > 0:
+                lines.append("{:>10g} - {:<8g} ms {:10}".format(low, high, count))
+        return lines
+
+
+class Receiver:
+    """Reads every datagram queued on `sock` each time it becomes readable.
+
+    `ready` is added to the event loop as `sock`'s reader. Each call
+    reads the socket's whole queue (up to `max_batch` datagrams) and
+    passes the batch to `handle(batch, times)`, with the (N,) receive
+    time of each datagram in `time.time()` seconds.
+
+    Where the kernel can timestamp datagrams (`SO_TIMESTAMPNS`, Linux),
+    each time is when that datagram arrived, so packets that queued up
+    while the loop was busy keep their real spacing, and `exact` is
+    `True`. Otherwise every datagram in a batch gets the time it was
+    read, and `exact` is `False`.
+    """
+
+    def __init__(self, sock: socket.socket, handle):
+        self.sock = sock
+        self.handle = handle
+        self.batches = 0
+        self.packets = 0
+        self.exact = False
+        if so_timestampns is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, so_timestampns, 1)
+                self.exact = True
+            except OSError:
+                pass
+        self.ancillary = socket.CMSG_SPACE(timespec.size) if self.exact else 0
+
+    def receive(self):
+        """Read one datagram, and its kernel timestamp (or `None`)."""
+        if not self.exact:
+            return self.sock.recv(2048), None
+        data, ancdata, flags, addr = self.sock.recvmsg(2048, self.ancillary)
+        for level, type, payload in ancdata:
+            if level == socket.SOL_SOCKET and type == so_timestampns and len(payload) >= timespec.size:
+                seconds, nanoseconds = timespec.unpack_from(payload)
+                return data, seconds + 1e-9 * nanoseconds
+        return data, None
+
+    def ready(self):
+        batch = []
+        stamps = []
+        try:
+            while len(batch) < max_batch:
+                data, stamp = self.receive()
+                batch.append(data)
+                stamps.append(stamp)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as exc:
+            print("receive error:", exc)
+        if len(batch) == 0:
+            return
+        now = time.time()
+        times = np.array([now if stamp is None else stamp for stamp in stamps])
+        self.batches += 1
+        self.packets += len(batch)
+        self.handle(batch, times)
+
+
+def open_socket(local_ip: str, local_port: int, rcvbuf: int):
+    """Join the housekeeping multicast group on a non-blocking socket with a `rcvbuf`-byte receive buffer."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+
+    sock.bind((mcast_group, local_port))
+    mreq = struct.pack("4s4s", socket.inet_aton(mcast_group), socket.inet_aton(local_ip))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    sock.setblocking(False)
+    return sock
+
+
+def kernel_drops(sock: socket.socket):
+    """Datagrams the kernel has dropped on `sock` for want of buffer space (Linux only, otherwise `None`)."""
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    try:
+        with open("/proc/net/udp") as udp:
+            for line in udp.readlines()[1:]:
+                fields = line.split()
+                if fields[9] == inode:
+                    return int(fields[12])
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class Table:
+    """An in-place terminal table of the latest value on every channel.
+
+    `update` only stores the newest sample from each chip, so it is
+    cheap to call per batch. `run` redraws at a fixed frame rate, and
+    only rewrites the cells whose text changed since the last frame.
+    """
+
+    label_width = 28
+    value_width = 8
+    # first terminal row of the channel table:
+    top = 3
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.errors = {chip: np.zeros(nperchip, dtype=np.uint8) for chip in range(1, nchip + 1)}
+        self.values = {chip: np.zeros(nperchip, dtype=np.float32) for chip in range(1, nchip + 1)}
+        self.seen = {chip: False for chip in range(1, nchip + 1)}
+        self.packets = 0
+        self.rate = 0.0
+        self.last = (time.time(), 0)
+        # text currently on screen, by (row, column):
+        self.drawn = {}
+        # rows used, after `top`:
+        self.height = nperchip + 2
+
+    def update(self, chips, errors, values):
+        """Keep the latest of the (N,) `chips`' (N, 9) `errors` and `values`."""
+        self.packets += len(chips)
+        for chip in self.errors:
+            rows = np.flatnonzero(chips == chip)
+            if len(rows) > 0:
+                self.errors[chip][:] = errors[rows[-1]]
+                self.values[chip][:] = values[rows[-1]]
+                self.seen[chip] = True
+
+    def cell(self, out: list, row: int, column: int, text: str, line: bool = False):
+        """Write `text` at `row`, `column` if it changed. A `line` cell owns the rest of its row, which is cleared after the text, so a shorter text leaves nothing behind."""
+        if self.drawn.get((row, column)) != text:
+            out.append("\033[{};{}H{}{}".format(row, column, text, "\033[K" if line else ""))
+            self.drawn[(row, column)] = text
+
+    def frame(self, drops: int|None = None, not_displayed: int = 0, lines: list[str] = ()):
+        """Write the changed cells, plus the packet rate and drop counters, and any other status `lines` below."""
+        out = []
+        if not self.drawn:
+            out.append("\033[2J")
+        now = time.time()
+        if now > self.last[0]:
+            self.rate = (self.packets - self.last[1]) / (now - self.last[0])
+        self.last = (now, self.packets)
+
+        self.cell(out, 1, 1, datetime.now().strftime("%d %b %Y %H:%M:%S"))
+        for c, chip in enumerate(self.errors):
+            column = 1 + c * (self.label_width + self.value_width + 4)
+            self.cell(out, self.top - 1, column, "chip {}".format(chip))
+            for ch in range(nperchip):
+                row = self.top + ch
+                self.cell(out, row, column, "{:{w}.{w}}".format(labels[chip][ch], w=self.label_width))
+                if not self.seen[chip]:
+                    text = " " * (self.value_width - 1) + "-"
+                elif self.errors[chip][ch] == 1:
+                    text = str_green("{:{w}.2f}".format(self.values[chip][ch], w=self.value_width))
+                else:
+                    text = str_red(" " * (self.value_width - 1) + "x")
+                self.cell(out, row, column + self.label_width, text)
+
+        status = "{:8.1f} packets/s  {:10} received  {:8} not displayed  {:>8} dropped by kernel".format(
+            self.rate, self.packets, not_displayed, "?" if drops is None else drops
+        )
+        self.cell(out, self.top + nperchip + 1, 1, status, line=True)
+        for k, line in enumerate(lines):
+            self.cell(out, self.top + nperchip + 2 + k, 1, line, line=True)
+        self.height = max(self.height, nperchip + 2 + len(lines))
+        if out:
+            self.stream.write("".join(out))
+            self.stream.flush()
+
+    async def run(self, fps: float, counters):
+        """Redraw `fps` times a second until cancelled. `counters()` gives the `frame` drop counts."""
+        self.stream.write("\033[?25l")
         try:
-            # read socket:
-            data = local_recv_socket.recv(2048)
-            if data[0] == 0x02 and data[5] == 0x12:
-                # print(data.hex())
-                sd = parse_rtd(data[8], data)
-                # print("chip", data[8])
-                # print("\terrors:", sd[1])
-                # print("\tvalues:", sd[2])
-                printstrip(data[8], sd[0], sd[1], sd[2])
-        except KeyboardInterrupt:
-            break
+            while True:
+                self.frame(*counters())
+                await asyncio.sleep(1 / fps)
+        finally:
+            self.stream.write("\033[{};1H\033[?25h\n".format(self.top + self.height))
+            self.stream.flush()
+
+
+async def display(queue: asyncio.Queue):
+    """Print each decoded batch from `queue` as it arrives."""
+    while True:
+        chips, errors, values = await queue.get()
+        for id, e, v in zip(chips, errors, values):
+            printstrip(id, range(nperchip), e, v)
+
+
+async def listen(args):
+    """Receive, decode and display housekeeping packets until cancelled."""
+    sock = open_socket(args.local_ip, args.local_port, args.rcvbuf)
+    print("joined! receive buffer", sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), "bytes")
+
+    # decoded batches wait here for the terminal, which can be slower
+    # than the network; when it is full, new batches are dropped.
+    queue = asyncio.Queue(maxsize=args.queue)
+    dropped = 0
+    capacity = int(np.ceil(args.history * 60 * args.rate))
+    histories = {chip: History(capacity) for chip in range(1, nchip + 1)}
+    buffers = {chip: DecodeBuffers() for chip in range(1, nchip + 1)}
+    # `handle` is defined below, once everything it feeds exists:
+    receiver = Receiver(sock, lambda batch, times: handle(batch, times))
+    if not receiver.exact:
+        print("no kernel receive timestamps: packets are timed per batch")
+    links = {chip: LinkStats(sequence=args.sequence, exact_times=receiver.exact) for chip in range(1, nchip + 1)}
+    recorder = Recorder(args.record, args.index_every) if args.record else None
+    table = Table() if args.display == "table" else None
+    if recorder is not None:
+        print("recording to", args.record)
+
+    def on_rtd(packets: list[bytes], times):
+        nonlocal dropped
+        rows = {}
+        for k, data in enumerate(packets):
+            if len(data) >= rtd_packet_size:
+                rows.setdefault(data[8], []).append(k)
+        for chip, mine in rows.items():
+            rtd = [packets[k] for k in mine]
+            # decoded into the chip's own buffers, which the next batch overwrites:
+            chips, errors, values = parse_rtd_batch(rtd, buffers.get(chip))
+            if chip in histories:
+                histories[chip].extend(times[mine], errors, values)
+                links[chip].update(rtd, times[mine])
+            if table is not None:
+                table.update(chips, errors, values)
+                continue
+            try:
+                queue.put_nowait((chips.copy(), errors.copy(), values.copy()))
+            except asyncio.QueueFull:
+                dropped += len(rtd)
+
+    dispatcher = Dispatcher()
+    dispatcher.register(housekeeping_system, rtd_type, "rtd", on_rtd)
+    power = None
+    if args.pow_type is not None:
+        power = power_monitor(args.pow_offset)
+        if power is None:
+            print("can't import adcparser: power packets will only be counted")
+        dispatcher.register(housekeeping_system, args.pow_type, "power", power)
+
+    def link_report():
+        lines = ["chip {}: {}".format(chip, link.summary()) for chip, link in links.items()]
+        if power is not None:
+            lines.append(power.summary())
+        return lines
+
+    async def report_every(seconds: float):
+        while True:
+            await asyncio.sleep(seconds)
+            for line in link_report():
+                print(line)
+
+    def handle(batch: list[bytes], times):
+        if recorder is not None:
+            recorder.write(batch, times)
+        dispatcher.dispatch(batch, times)
+
+    loop = asyncio.get_running_loop()
+    loop.add_reader(sock.fileno(), receiver.ready)
+    if table is not None:
+        printer = asyncio.create_task(table.run(args.fps, lambda: (kernel_drops(sock), dropped, dispatcher.report() + link_report())))
+    else:
+        printer = asyncio.create_task(display(queue))
+    tasks = [printer]
+    if args.stats > 0 and table is None:
+        tasks.append(asyncio.create_task(report_every(args.stats)))
+    try:
+        await asyncio.Future()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        loop.remove_reader(sock.fileno())
+        sock.close()
+        if recorder is not None:
+            recorder.close()
+        print("received", receiver.packets, "packets in", receiver.batches, "batches,", dropped, "not displayed")
+        for line in dispatcher.report():
+            print(line)
+        if power is not None:
+            print(power.summary())
+        for chip, link in links.items():
+            if link.packets > 0:
+                print("chip {}: {}".format(chip, link.summary()))
+                print("  inter-arrival times:")
+                for line in link.histogram():
+                    print("  " + line)
+        for chip, history in histories.items():
+            if len(history) > 0:
+                low, high, mean = history.stats(60)
+                print("chip", chip, "last 60 s mean:", " ".join("{:6.2f}".format(m) for m in mean))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.benchmark > 0:
+        benchmark(args.benchmark)
+        sys.exit(0)
+
+    try:
+        asyncio.run(listen(args))
+    except KeyboardInterrupt:
+        pass
 
     # time-tag and save the data
     # read the save file and liveplot
@@ -1,19 +1,158 @@
-import os, sys
+import os, sys, time
+import argparse
 import numpy as np
-from matplotlib import pyplot as plt
 
-import pprint
-
-from ..rtd.rtd import Parser
+from ..rtd.rtd import decode_frames
 from external.telemetry_tools.parsers.RTDparser import rtdparser
 
+nchannel = 9
+
+
+def find_logs(paths: list[str], name: str = "housekeeping_rtd.log"):
+    """All files in `paths`, plus every file called `name` under the folders in `paths`."""
+    result = []
+    for path in paths:
+        if os.path.isfile(path):
+            result.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            if name in files:
+                result.append(os.path.join(root, name))
+    return sorted(result)
+
+
+def gse_columns(frames):
+    """
+    Convert `rtdparser` output to the columns `decode_frames` returns.
+
+    This assumes `rtdparser` gives one entry per 42-byte frame in file
+    order, and that each entry is a `dict` (or a `(dict, error)` tuple,
+    as `adcparser` returns) shaped like one `Parser.rtd_data` measurement
+    plus the chip number:
+
+        {'chip': 1, 'unixtime': b'\\x01\\x23\\x45\\x67',
+         'data': {0: {'flag': 1, 'temp': 21.5}, ..., 8: {...}}}
+
+    `unixtime` may also be an `int`. If the external parser changes
+    shape, this is the only function that needs to follow it.
+    """
+    n = len(frames)
+    chip = np.zeros(n, dtype=np.uint8)
+    unixtime = np.zeros(n, dtype=np.uint32)
+    flag = np.zeros((n, nchannel), dtype=np.uint8)
+    temp = np.zeros((n, nchannel), dtype=np.float64)
+    for k, frame in enumerate(frames):
+        if isinstance(frame, tuple):
+            frame = frame[0]
+        chip[k] = frame['chip']
+        stamp = frame['unixtime']
+        unixtime[k] = int.from_bytes(stamp, 'big') if isinstance(stamp, (bytes, bytearray)) else int(stamp)
+        for ch in range(nchannel):
+            flag[k, ch] = frame['data'][ch]['flag']
+            temp[k, ch] = frame['data'][ch]['temp']
+    return {'chip': chip, 'unixtime': unixtime, 'flag': flag, 'temp': temp}
+
+
+def compare(local: dict, gse: dict, atol: float):
+    """
+    Compare two sets of decoded columns frame by frame.
+
+    Parameters
+    ----------
+    `local`, `gse`: `dict`s of `chip`, `unixtime`, `flag` and `temp`
+        arrays, as from `decode_frames` and `gse_columns`.
+    `atol`: largest temperature difference (ºC) counted as equal.
+
+    Only the frames both decoders produced are compared. Returns a
+    `dict` of mismatch counts: `frames` (each decoder's frame count),
+    `chip` and `unixtime` (frames that differ), and `flag` and `temp`
+    ((9,) per channel), plus `max_dtemp`, the largest difference seen.
+    """
+    n = min(len(local['chip']), len(gse['chip']))
+    local_temp = np.asarray(local['temp'][:n], dtype=np.float64)
+    gse_temp = gse['temp'][:n]
+    dtemp = np.abs(local_temp - gse_temp)
+    return {
+        'frames': (len(local['chip']), len(gse['chip'])),
+        'chip': int(np.count_nonzero(local['chip'][:n] != gse['chip'][:n])),
+        'unixtime': int(np.count_nonzero(local['unixtime'][:n] != gse['unixtime'][:n])),
+        'flag': np.count_nonzero(local['flag'][:n] != gse['flag'][:n], axis=0),
+        'temp': np.count_nonzero(~np.isclose(local_temp, gse_temp, rtol=0, atol=atol), axis=0),
+        'max_dtemp': float(np.nanmax(dtemp)) if n > 0 else 0.0,
+    }
+
+
+def diff_file(file: str, atol: float):
+    """
+    Decode `file` with both decoders and compare them.
+
+    Returns `(result, timing)`, where `result` is from `compare` and
+    `timing` maps each decoder's name to its decode time in seconds.
+    """
+    with open(file, 'rb') as d:
+        raw = d.read()
+
+    start = time.perf_counter()
+    local = decode_frames(raw)
+    local_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gse = gse_columns(rtdparser(raw.hex()))
+    gse_time = time.perf_counter() - start
+
+    return compare(local, gse, atol), {'decode_frames': local_time, 'rtdparser': gse_time}
+
+
+def is_match(result: dict):
+    nlocal, ngse = result['frames']
+    return nlocal == ngse and result['chip'] == 0 and result['unixtime'] == 0 and not np.any(result['flag']) and not np.any(result['temp'])
+
+
+def report(file: str, result: dict):
+    """Print one line for `file`, and a per-channel line for any mismatched field."""
+    nlocal, ngse = result['frames']
+    status = "ok" if is_match(result) else "MISMATCH"
+    print("{:8} {}  frames {}/{}  chip {}  unixtime {}  max |dT| {:.6f}".format(
+        status, file, nlocal, ngse, result['chip'], result['unixtime'], result['max_dtemp']
+    ))
+    for field in ('flag', 'temp'):
+        if np.any(result[field]):
+            print("         {:5} mismatches by channel: {}".format(field, " ".join("{:6}".format(c) for c in result[field])))
+
+
+# command line argument setup
+parser = argparse.ArgumentParser("rtddiff.py")
+parser.add_argument("paths", nargs="+", help="RTD log files, or folders to search for housekeeping_rtd.log files")
+parser.add_argument("--atol", help="largest temperature difference (ºC) to count as equal (default 1/2048)", type=float, default=1/2048)
+
 if __name__ == "__main__":
-    f = sys.argv[1]
-    print('reading from ', f)
-    with open(f, 'rb') as d:
-        strdata = d.read().hex()
-    gse_parse = rtdparser(strdata)
-    loc_parse = Parser(f)
-
-    pprint.pprint(gse_parse[0])
-    pprint.pprint(loc_parse.rtd_data[1][5]['unixtime'].hex())
\ No newline at end of file
+    args = parser.parse_args()
+    files = find_logs(args.paths)
+    if len(files) == 0:
+        print("found no RTD logs.")
+        sys.exit(1)
+
+    nbytes = 0
+    nframes = 0
+    timing = {'decode_frames': 0.0, 'rtdparser': 0.0}
+    flag_total = np.zeros(nchannel, dtype=np.int64)
+    temp_total = np.zeros(nchannel, dtype=np.int64)
+    failed = 0
+    for f in files:
+        result, elapsed = diff_file(f, args.atol)
+        report(f, result)
+        nbytes += os.path.getsize(f)
+        nframes += result['frames'][0]
+        for name in timing:
+            timing[name] += elapsed[name]
+        flag_total += result['flag']
+        temp_total += result['temp']
+        failed += not is_match(result)
+
+    print()
+    print("{} of {} files mismatched".format(failed, len(files)))
+    print("flag mismatches by channel: ", " ".join("{:6}".format(c) for c in flag_total))
+    print("temp mismatches by channel: ", " ".join("{:6}".format(c) for c in temp_total))
+    for name, seconds in timing.items():
+        print("{:14}{:12.0f} frames/s {:10.1f} MB/s".format(name, nframes / seconds if seconds > 0 else np.inf, nbytes / 1e6 / seconds if seconds > 0 else np.inf))
+    sys.exit(1 if failed else 0)
@@ -153,11 +153,15 @@ class Log:
                  readtimeformat='%H:%M:%S', 
                  readdatetimeformat='%d-%m-%Y_%H-%M-%S', 
                  abstimeoffset=datetime.timedelta(seconds=0), # compensate for the fact that Formatter times are offset from the start of GSE time
-                 configpath=os.path.join(os.path.dirname(__file__), '..', '..', 'external', 'foxsi4-commands')):
+                 configpath=os.path.join(os.path.dirname(__file__), '..', '..', 'external', 'foxsi4-commands'),
+                 cache=None, # an rtd.ParseCache to reuse decoded logs from
+                 resync=False): # find RTD frame boundaries with rtd.scan_frames, for logs with dropped bytes
         
         self.readtimeformat = readtimeformat
         self.readdatetimeformat = readdatetimeformat
         self.abstimeoffset = abstimeoffset
+        self.cache = cache
+        self.resync = resync
 
         if configpath is not None:
             self.deck = command_deck(configpath)
@@ -170,59 +174,74 @@ class Log:
         start_datetime = detect_datetime_folder(log)
         start_datetime += self.abstimeoffset
 
-        with open(log, 'rb') as flog:
-                raw = flog.read()
-        
         fname = os.path.basename(log)
+        self.kind = fname
         
         if fname == 'housekeeping_rtd.log':
             # from external.telemetry_tools.parsers.RTDparser import rtdparser
             from ..rtd.rtd import Parser
             self.frame_size = 42
-            parsed = Parser(log)
+            parsed = Parser(log, cache=self.cache, resync=self.resync)
 
-            chip_channel_offset = {1:1,2:12}
+            # structure of self.samples: keys are RTD chip numbers (1, 2), values are rtd.RTDSamples.
+            # self.times has the same keys, and holds the absolute np.datetime64 time of each sample.
+            self.samples = parsed.samples
+            self.times = {}
             for chip in [1,2]:
-                unixtimes = np.array([int.from_bytes(field['unixtime'],'big') for field in parsed.rtd_data[chip]], dtype=np.uint32)
-                reltimes = unixtimes - np.min(unixtimes)
-                abstimes = [start_datetime + datetime.timedelta(seconds=time.item()) for time in reltimes]
-                d = {}
-                for t, data in zip(abstimes, parsed.rtd_data[chip]):
-                    d[t] = {k + chip_channel_offset[chip]: data['data'][k] for k in data['data']}
-                    if t in self.data.keys():
-                        self.data[t].update(d[t])
-                    else:
-                        self.data[t] = d[t]
+                unixtimes = self.samples[chip].unixtime
+                reltimes = unixtimes - (np.min(unixtimes) if len(unixtimes) > 0 else 0)
+                self.times[chip] = np.datetime64(start_datetime, 'us') + reltimes.astype('timedelta64[s]')
 
-            # structure of self.data: keys are datetimes, values are dicts keyed by RTD sensor number (1-9, 12-20).
-            #      self.data[t][7]['temp'] is the temperature
-            #      self.data[t][7]['flag'] is the flag
+            firsts = [self.times[chip][0] for chip in self.times if len(self.times[chip]) > 0]
+            self.start = min(firsts).astype(datetime.datetime) if len(firsts) > 0 else start_datetime
                 
         elif fname == 'housekeeping_pow.log':
             from external.telemetry_tools.parsers.Powerparser import adcparser
             self.frame_size = 38
             print('parsing ', log)
-            parsed = []
-            for d in fragment_bytes(raw, self.frame_size):
-                res = adcparser(d)
-                if res[1]:
-                    continue
-                else:
-                    parsed.append(res)
+            columns = self.cache.load(log, 'pow') if self.cache is not None else None
+            if columns is None:
+                with open(log, 'rb') as flog:
+                    raw = flog.read()
+                parsed = []
+                for d in fragment_bytes(raw, self.frame_size):
+                    res = adcparser(d)
+                    if res[1]:
+                        continue
+                    else:
+                        parsed.append(res)
+
+                # columns: unixtime per frame, and the value of each channel (by key) per frame
+                keys = [k for k in parsed[0][0].keys() if k != 'unixtime'] if len(parsed) > 0 else []
+                columns = {
+                    'unixtime': np.array([frame[0]['unixtime'] for frame in parsed], dtype=np.float64),
+                    'keys': np.array(keys, dtype=np.int64),
+                    'values': np.array([[frame[0][k] for k in keys] for frame in parsed], dtype=np.float64).reshape(len(parsed), len(keys)),
+                }
+                if self.cache is not None:
+                    self.cache.store(log, columns, 'pow')
             
-            d = {}
-            unixtime0 = 0
-            for k,frame in enumerate(parsed):
-                unixtime = frame[0]['unixtime']
-                if k == 0:
-                    unixtime0 = unixtime
-                reltime = unixtime - unixtime0
+            keys = columns['keys'].tolist()
+            unixtimes = columns['unixtime'].tolist()
+            for unixtime, values in zip(unixtimes, columns['values'].tolist()):
+                reltime = unixtime - unixtimes[0]
                 abstime = start_datetime + datetime.timedelta(seconds=reltime)
-                d[abstime] = {k:frame[0][k] for k in frame[0].keys() if k != 'unixtime'}
-                self.data[abstime] = d[abstime]
+                self.data[abstime] = dict(zip(keys, values))
+
+            self.start = next(iter(self.data), start_datetime)
 
         else:
             raise NotImplementedError
+
+    def merge(self, other):
+        """ append the data from another `Log` of the same kind """
+        if self.kind == 'housekeeping_rtd.log':
+            for chip in self.samples:
+                theirs = other.samples[chip]
+                self.samples[chip].extend(theirs.unixtime, theirs.flag, theirs.temp)
+                self.times[chip] = np.concatenate((self.times[chip], other.times[chip]))
+        else:
+            self.data.update(other.data)
         
 class StripChart:
     def __init__(self, 
@@ -234,7 +253,8 @@ class StripChart:
                  readtimeformat='%H:%M:%S.%f',
                  maxnotelength=40,
                  figpath=None,
-                 annotateallplots=False):
+                 annotateallplots=False,
+                 cache=None):
         self.displaydatetimeformat = displaydatetimeformat
         self.readdatetimeformat = readdatetimeformat
         self.readtimeformat = readtimeformat
@@ -268,25 +288,25 @@ class StripChart:
 
         if isinstance(logfolder, list) and len(logfolder) > 0:
             print(logfolder)
-            all_rtd_log = [Log(os.path.join(f, 'housekeeping_rtd.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset)) for f in logfolder]
-            all_pow_log = [Log(os.path.join(f, 'housekeeping_pow.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset)) for f in logfolder]
+            all_rtd_log = [Log(os.path.join(f, 'housekeeping_rtd.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset), cache=cache) for f in logfolder]
+            all_pow_log = [Log(os.path.join(f, 'housekeeping_pow.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset), cache=cache) for f in logfolder]
 
-            all_rtd_log = sorted(all_rtd_log, key=lambda l: list(l.data.keys())[0])
-            all_pow_log = sorted(all_pow_log, key=lambda l: list(l.data.keys())[0])
+            all_rtd_log = sorted(all_rtd_log, key=lambda l: l.start)
+            all_pow_log = sorted(all_pow_log, key=lambda l: l.start)
             for k in range(0,len(logfolder)):
                 if k == 0:
                     self.powlog = all_pow_log[k]
                     self.rtdlog = all_rtd_log[k]
                 else:
-                    self.powlog.data.update(all_pow_log[k].data)
-                    self.rtdlog.data.update(all_rtd_log[k].data)
+                    self.powlog.merge(all_pow_log[k])
+                    self.rtdlog.merge(all_rtd_log[k])
 
             # raise NotImplementedError
         elif isinstance(logfolder, str):
             # self.powlog = Log(os.path.join(logfolder, 'housekeeping_pow.log'), abstimeoffset=datetime.timedelta(minutes=24))
             # self.rtdlog = Log(os.path.join(logfolder, 'housekeeping_rtd.log'), abstimeoffset=datetime.timedelta(minutes=24))
-            self.powlog = Log(os.path.join(logfolder, 'housekeeping_pow.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset))
-            self.rtdlog = Log(os.path.join(logfolder, 'housekeeping_rtd.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset))
+            self.powlog = Log(os.path.join(logfolder, 'housekeeping_pow.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset), cache=cache)
+            self.rtdlog = Log(os.path.join(logfolder, 'housekeeping_rtd.log'), abstimeoffset=datetime.timedelta(seconds=log_to_note_offset), cache=cache)
 
         # figure-tuning parameters:
         self.do_volt_rel = True     # display voltage as relative to mean for each channel, rather than absolute
@@ -352,39 +372,33 @@ class StripChart:
    
     def provision_data(self):
         
-        self.rtd_times = list(self.rtdlog.data.keys())
+        # every RTD sample time, from either chip:
+        all_times = np.unique(np.concatenate([self.rtdlog.times[chip] for chip in self.rtdlog.times]))
+        self.rtd_times = all_times.tolist()
         
+        # sensor numbers are chip 1 channels + 1, and chip 2 channels + 12:
         self.cold_sensors = [5, 6, 7, 8, 9]
         self.hot_sensors = [1, 2, 3, 4]
         self.opt_sensors = [12, 13, 14, 15, 16, 17, 18, 19, 20]
-        self.cold_data = np.zeros((len(self.rtd_times), len(self.cold_sensors)), dtype=np.float32)
-        self.cold_flag_data = np.zeros((len(self.rtd_times), 1), dtype=np.float32)
-        self.hot_data = np.zeros((len(self.rtd_times), len(self.hot_sensors)), dtype=np.float32)
-        self.hot_flag_data = np.zeros((len(self.rtd_times), 1), dtype=np.float32)
-        self.opt_data = np.zeros((len(self.rtd_times), len(self.opt_sensors)), dtype=np.float32)
-        self.opt_flag_data = np.zeros((len(self.rtd_times), 1), dtype=np.float32)
-        for k,key in enumerate(self.rtd_times):
-            for s,sensor in zip(range(len(self.cold_sensors)), self.cold_sensors):
-                if sensor in self.rtdlog.data[key].keys():
-                    if self.rtdlog.data[key][sensor]['flag'] == 1:
-                        self.cold_data[k,s] = self.rtdlog.data[key][sensor]['temp']
-                    else:
-                        self.cold_flag_data[k] += 1
-                        self.cold_data[k,s] = np.nan
-            for s,sensor in zip(range(len(self.hot_sensors)), self.hot_sensors):
-                if sensor in self.rtdlog.data[key].keys():
-                    if self.rtdlog.data[key][sensor]['flag'] == 1:
-                        self.hot_data[k,s] = self.rtdlog.data[key][sensor]['temp']
-                    else:
-                        self.hot_flag_data[k] += 1
-                        self.hot_data[k,s] = np.nan
-            for s,sensor in zip(range(len(self.opt_sensors)), self.opt_sensors):
-                if sensor in self.rtdlog.data[key].keys():
-                    if self.rtdlog.data[key][sensor]['flag'] == 1:
-                        self.opt_data[k,s] = self.rtdlog.data[key][sensor]['temp']
-                    else:
-                        self.opt_flag_data[k] += 1
-                        self.opt_data[k,s] = np.nan
+        chip_channel_offset = {1:1,2:12}
+        groups = {}
+        for name, sensors in (('cold', self.cold_sensors), ('hot', self.hot_sensors), ('opt', self.opt_sensors)):
+            data = np.zeros((len(self.rtd_times), len(sensors)), dtype=np.float32)
+            flag_data = np.zeros((len(self.rtd_times), 1), dtype=np.float32)
+            for chip in self.rtdlog.samples:
+                pairs = [(s, sensor - chip_channel_offset[chip]) for s, sensor in enumerate(sensors) if 0 <= sensor - chip_channel_offset[chip] < 9]
+                if len(pairs) == 0:
+                    continue
+                columns, channels = map(list, zip(*pairs))
+                rows = np.searchsorted(all_times, self.rtdlog.times[chip])
+                samples = self.rtdlog.samples[chip]
+                valid = samples.flag[:, channels] == 1
+                data[rows[:, None], columns] = np.where(valid, samples.temp[:, channels], np.nan)
+                flag_data[rows, 0] += np.sum(~valid, axis=1)
+            groups[name] = (data, flag_data)
+        self.cold_data, self.cold_flag_data = groups['cold']
+        self.hot_data, self.hot_flag_data = groups['hot']
+        self.opt_data, self.opt_flag_data = groups['opt']
 
         self.pow_times = list(self.powlog.data.keys())
         self.volt_sensors = [0, 1, 2, 3]
@@ -411,18 +425,25 @@ class StripChart:
                 self.volt_data[:,m] = self.volt_data[:,m] - np.mean(self.volt_data[:,m])
 
     def plot_all(self):
-        self.ax['cold_data'].plot(self.cold_data, self.rtd_times, label=[rtd_labels[s] for s in self.cold_sensors])
-        self.ax['cold_flag'].plot(self.cold_flag_data, self.rtd_times, color='black')
-        self.ax['hot_data'].plot(self.hot_data, self.rtd_times, label=[rtd_labels[s] for s in self.hot_sensors])
-        self.ax['hot_flag'].plot(self.hot_flag_data, self.rtd_times, color='black')
+        from ..rtd.rtd import decimate
+        # time runs down the page, so decimate to the figure height in pixels (the saved figure is 17 inches tall):
+        buckets = int(max(self.fig.get_figheight(), 17 if self.figpath is not None else 0) * self.fig.dpi)
+        def plot_decimated(ax, data, times, **kwargs):
+            t, d = decimate(times, data, buckets)
+            ax.plot(d, t, **kwargs)
+
+        plot_decimated(self.ax['cold_data'], self.cold_data, self.rtd_times, label=[rtd_labels[s] for s in self.cold_sensors])
+        plot_decimated(self.ax['cold_flag'], self.cold_flag_data, self.rtd_times, color='black')
+        plot_decimated(self.ax['hot_data'], self.hot_data, self.rtd_times, label=[rtd_labels[s] for s in self.hot_sensors])
+        plot_decimated(self.ax['hot_flag'], self.hot_flag_data, self.rtd_times, color='black')
         # self.ax['opt_data'].plot(self.opt_data, self.rtd_times, marker='+', markersize=4, label=[rtd_labels[s] for s in self.opt_sensors])
-        self.ax['opt_data'].plot(self.opt_data, self.rtd_times, label=[rtd_labels[s] for s in self.opt_sensors])
-        self.ax['opt_flag'].plot(self.opt_flag_data, self.rtd_times, color='black')
+        plot_decimated(self.ax['opt_data'], self.opt_data, self.rtd_times, label=[rtd_labels[s] for s in self.opt_sensors])
+        plot_decimated(self.ax['opt_flag'], self.opt_flag_data, self.rtd_times, color='black')
 
         [ax.set_xlim([-1, 9]) for ax in self.flag_axes]
 
-        self.ax['volt'].plot(self.volt_data, self.pow_times, label=[pow_labels[s] for s in self.volt_sensors])
-        self.ax['curr'].plot(self.curr_data, self.pow_times, label=[pow_labels[s] for s in self.curr_sensors])
+        plot_decimated(self.ax['volt'], self.volt_data, self.pow_times, label=[pow_labels[s] for s in self.volt_sensors])
+        plot_decimated(self.ax['curr'], self.curr_data, self.pow_times, label=[pow_labels[s] for s in self.curr_sensors])
 
         for name in self.legendary_axis_names:
             h,l = self.ax[name].get_legend_handles_labels()
@@ -563,10 +584,11 @@ if __name__ == "__main__":
             all_paths = [os.path.join(sys.argv[1], c) for c in all_candidates]
             logfolders = [c for c in all_paths if os.path.isdir(c)]
     
+    from ..rtd.rtd import ParseCache
     if len(sys.argv) == 3:
-        s = StripChart(logfolder=logfolders, notes=sys.argv[2], annotateallplots=True)
+        s = StripChart(logfolder=logfolders, notes=sys.argv[2], annotateallplots=True, cache=ParseCache())
     if len(sys.argv) == 4:
-        s = StripChart(logfolder=logfolders, notes=sys.argv[2], figpath=sys.argv[3], annotateallplots=False)
+        s = StripChart(logfolder=logfolders, notes=sys.argv[2], figpath=sys.argv[3], annotateallplots=False, cache=ParseCache())
     
     cmos_in_file = os.path.abspath(os.path.expanduser('~/Documents/FOXSI/Data/formatter/logs/2025/aug28/cmos_power.csv'))
     cmos_out_file = os.path.abspath(os.path.expanduser('~/Documents/FOXSI/Data/formatter/logs/2025/aug28/cmos_power_window.csv'))